@@ -0,0 +1,110 @@
+import abc
+import asyncio
+import aiohttp
+from plugins.inspurai.inspurai import Yuan
+from plugins.inspurai.scheduler import FIRST
+from plugins.Ernie.Zeus import Zeus
+
+
+class GenerationBackend(abc.ABC):
+    """
+    common async interface of the text generation backends used by DramaPlugin and theater.Drama.
+    generate returns the pure text reply cut at trun, '' when the backend could not produce one
+    """
+    name = 'base'
+
+    @abc.abstractmethod
+    async def generate(self, prompt: str, trun: str = '”', priority: int = FIRST) -> str:
+        ...
+
+    def fingerprint(self, prompt: str, trun: str = '”') -> tuple:
+        """everything that decides the reply of prompt, the key of the GenerationCache"""
+        return self.name, prompt, trun
+
+    async def aclose(self) -> None:
+        pass
+
+
+class YuanBackend(GenerationBackend):
+    """Inspur Yuan 1.0, rate limited by the process-wide YuanScheduler"""
+    name = 'yuan'
+
+    def __init__(self, yuan: Yuan = None, **kwargs) -> None:
+        self.yuan = yuan or Yuan(**kwargs)
+
+    async def generate(self, prompt: str, trun: str = '”', priority: int = FIRST) -> str:
+        return await self.yuan.asubmit_API(prompt, trun=trun, priority=priority)
+
+    def fingerprint(self, prompt: str, trun: str = '”') -> tuple:
+        yuan = self.yuan
+        return (self.name, yuan.engine, yuan.craft_query(prompt), trun, yuan.max_tokens, yuan.temperature, yuan.topP,
+                yuan.topK, yuan.frequencyPenalty, yuan.responsePenalty, yuan.noRepeatNgramSize)
+
+
+class ZeusBackend(GenerationBackend):
+    """Baidu Ernie 3.0 Zeus, needs BAIDU_ACCESS_TOKEN. the client is blocking so it runs in the default executor"""
+    name = 'zeus'
+
+    def __init__(self, zeus: Zeus = None) -> None:
+        self.zeus = zeus or Zeus()
+
+    async def generate(self, prompt: str, trun: str = '”', priority: int = FIRST) -> str:
+        # zeus takes at most 256 chars, keep the tail that ends with the action
+        reply = await asyncio.get_running_loop().run_in_executor(None, self.zeus.get_response, prompt[-256:])
+        if not reply:
+            return ''
+        return reply.split(trun)[0] if trun else reply
+
+    def fingerprint(self, prompt: str, trun: str = '”') -> tuple:
+        return self.name, prompt[-256:], trun
+
+
+class LocalBackend(GenerationBackend):
+    """client of the local stand-in server (python -m plugins.standin serve), for offline load tests"""
+    name = 'local'
+
+    def __init__(self, url: str = 'http://localhost:8090/generate', timeout: float = 30) -> None:
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+
+    async def generate(self, prompt: str, trun: str = '”', priority: int = FIRST) -> str:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        try:
+            async with self._session.post(self.url, json={'prompt': prompt, 'trun': trun},
+                                          timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                if response.status != 200:
+                    return ''
+                result = await response.json()
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError):
+            return ''
+        return result.get('reply', '')
+
+    def fingerprint(self, prompt: str, trun: str = '”') -> tuple:
+        return self.name, self.url, prompt, trun
+
+    async def aclose(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+BACKENDS = {
+    'yuan': YuanBackend,
+    'zeus': ZeusBackend,
+    'local': LocalBackend,
+}
+
+
+def create_backend(config: dict, yuan: Yuan = None) -> GenerationBackend:
+    """
+    build a backend from a settings.json section, e.g. {"type": "local", "url": "http://localhost:8090/generate"}.
+    an existing Yuan instance is reused for type yuan
+    """
+    config = dict(config)
+    kind = config.pop('type', 'yuan')
+    if kind not in BACKENDS:
+        raise RuntimeError(f'unknown generation backend {kind}, choose from {list(BACKENDS)}')
+    if kind == 'yuan' and yuan is not None and not config:
+        return YuanBackend(yuan)
+    return BACKENDS[kind](**config)
@@ -1,9 +1,9 @@
 import os
 import json
-import time
+import asyncio
+import random
 import re
 import wechaty
-from paddlenlp import Taskflow
 from typing import Optional
 import xlrd
 from wechaty import (
@@ -13,10 +13,20 @@ from wechaty import (
     Message,
     WechatyPluginOptions
 )
-from plugins.paddleasr import asr
 from utils.DFAFilter import DFAFilter
 from utils.rasaintent import RasaIntent
+from utils.circuitbreaker import CircuitBreaker
 from plugins.inspurai.inspurai import Yuan
+from plugins.inspurai.url_config import YuanTransport, set_transport
+from plugins.inspurai.scheduler import YuanScheduler, SchedulerFull, get_scheduler, set_scheduler, FIRST, RETRY
+from plugins.backends import create_backend, ZeusBackend
+from plugins.gencache import GenerationCache
+from plugins.promptbuilder import PromptBuilder
+from plugins.uieservice import UIEService
+from plugins.inference import InferenceExecutor, embed_texts
+from plugins.memoryindex import SelfMemoryIndex
+from plugins.memorystore import IndexedMemory, BoundedMemory
+from plugins.semantic import load_vectors
 
 
 class DramaPlugin(WechatyPlugin):
@@ -54,6 +64,13 @@ class DramaPlugin(WechatyPlugin):
             self.logger.warning('there must be at least one director and no null items, pls retry')
             raise RuntimeError('Drama director.json not valid, pls refer to above info and try again')
 
+        # optional runtime settings, one section per component, e.g. {"rasa": {"port": "5005,5006"}}
+        if "settings.json" in self.config_files:
+            with open(os.path.join(self.config_url, 'settings.json'), 'r', encoding='utf-8') as f:
+                self.settings = json.load(f)
+        else:
+            self.settings = {}
+
         # 4. load scenario rule-table
         self.scenarios = self._load_scenarios()
         if self.scenarios is None:
@@ -66,9 +83,36 @@ class DramaPlugin(WechatyPlugin):
             self.logger.warning('there must be at least one in the focus.json and no empty should be, pls retry')
             raise RuntimeError('Drama focus.json not valid, pls refer to above info and try again')
 
-        self.uie = Taskflow('information_extraction', schema=self.schema, task_path='uie/checkpoint/model_best')
+        uie_model = 'uie/checkpoint/model_best'
+        # UIE and ASR run on the inference workers, {"inference": {"workers": 2, "max_queue": 32}}.
+        # extraction requests of all conversations are batched, {"uie": {"window": 0.01, "max_batch": 16}},
+        # each worker keeps one Taskflow and switches it to the schema subset of each batch.
+        # {"uie": {"mode": "onnx", "num_threads": 2}} serves the int8 export of plugins.uieonnx instead (experimental,
+        # check it with `python -m plugins.uieonnx compare` first)
+        uie_settings = dict(self.settings.get('uie', {}))
+        uie_config = {'schema': self.schema, 'task_path': uie_model}
+        for key in ('mode', 'onnx_model', 'num_threads'):
+            if key in uie_settings:
+                uie_config[key] = uie_settings.pop(key)
+        # no longer used, one model copy per worker serves every schema subset
+        uie_settings.pop('max_predictors', None)
+        # optional embedding retrieval when the entities find nothing, {"semantic": {"top_k": 3, "min_score": 0.6}}
+        self.semantic = self.settings.get('semantic')
+        embedding = {'model': self.semantic.get('model', 'simbert-base-chinese')} if self.semantic else None
+        self.inference = InferenceExecutor(uie=uie_config, embedding=embedding, **self.settings.get('inference', {}))
+        self.uie_service = UIEService(self.inference, self.schema, **uie_settings)
+
+        # topics of memory.txt lines persisted across restarts, rebuilt when the served weights or the threshold change.
+        # stamped on the weight file itself, finetune.py overwrites it in place without touching the directory mtime
+        if uie_config.get('mode') == 'onnx':
+            served = uie_config.get('onnx_model', 'uie/export/inference.int8.onnx')
+        else:
+            served = os.path.join(uie_model, 'model_state.pdparams')
+        weights = os.stat(served) if os.path.exists(served) else None
+        stamp = f"{self.uie_service.threshold}|{served}|{weights.st_mtime_ns if weights else ''}|{weights.st_size if weights else ''}"
+        self.memory_index = SelfMemoryIndex(os.path.join(self.file_cache, 'self_memory_index.json'), stamp)
 
-        self.self_memory = self._load_memory()
+        self.self_memory = self._load_self_memory()
         if not self.self_memory:
             raise RuntimeError('Drada memory.txt not valid, pls refer to above info and try again')
 
@@ -77,16 +121,21 @@ class DramaPlugin(WechatyPlugin):
         else:
             self.relations = {}
 
+        # the schema keys each (scenario, character) extracts
+        self.scenario_schema = self._scenario_schemas()
+
+        # static prompt parts per (scenario, character) and the prompt length budget, {"prompt": {"budget": 1000}}
+        self.prompt_builder = PromptBuilder(self.relations, self.scenarios, **self.settings.get('prompt', {}))
+
         if "users.json" in self.config_files:
             with open(os.path.join(self.config_url, 'users.json'), 'r', encoding='utf-8') as f:
                 self.users = json.load(f)
         else:
             self.users = {}
 
-        if self.users:
-            self.user_memory = dict.fromkeys(self.users.keys(), dict.fromkeys(self.scenarios.keys(), []))
-        else:
-            self.user_memory = {}
+        # one bounded memory per user and scenario, {"user_memory": {"max_items": 50, "max_chars": 3000}}
+        self.user_memory_settings = self.settings.get('user_memory', {})
+        self.user_memory = {}
 
         if "last_turn_memory.json" in self.config_files:
             with open(os.path.join(self.config_url, 'last_turn_memory.json'), 'r', encoding='utf-8') as f:
@@ -99,6 +148,10 @@ class DramaPlugin(WechatyPlugin):
                         self.last_turn_memory[key] = json.load(f)
 
         # 6. initialize yuan-api
+        if 'yuan_transport' in self.settings:
+            set_transport(YuanTransport(**self.settings['yuan_transport']))
+        if 'yuan_scheduler' in self.settings:
+            set_scheduler(YuanScheduler(**self.settings['yuan_scheduler']))
         self.yuan = Yuan(engine='dialog',
                          temperature=1,
                          max_tokens=150,
@@ -114,10 +167,34 @@ class DramaPlugin(WechatyPlugin):
         engine_name = self.yuan.get_engine()
         self.logger.info(f'with yuan engine:{engine_name},with temperature=1, max_tokens=150, topK=3, topP=0.9, frequencyPenalty=1.2')
 
+        # generation backend, yuan unless settings.json says otherwise: {"backend": {"type": "local"}}
+        self.backend = create_backend(self.settings.get('backend', {}), yuan=self.yuan)
+
+        # when the backend keeps failing the breaker opens and replies come from the fallback:
+        # settings.json "fallback" backend, else Ernie Zeus if BAIDU_ACCESS_TOKEN is set,
+        # else the FALLBACKREPLY lines of the scenario rules
+        self.breaker = CircuitBreaker(self.backend.name, **self.settings.get('breaker', {}))
+        self.breaker.add_listener(lambda name, old, new: self.logger.warning(f'circuit {name}: {old} -> {new}'))
+        if 'fallback' in self.settings:
+            self.fallback = create_backend(self.settings['fallback'])
+        elif os.environ.get('BAIDU_ACCESS_TOKEN'):
+            self.fallback = ZeusBackend()
+        else:
+            self.fallback = None
+
+        # replies of cacheable actions (CACHEABLE rule or CACHE action prefix), e.g. the scenario openings
+        # every new user gets. {"generation_cache": {"maxsize": 2048, "ttl": 86400, "disk": true}}
+        cache_settings = dict(self.settings.get('generation_cache', {}))
+        cache_path = os.path.join(self.file_cache, 'generation_cache.sqlite3') if cache_settings.pop('disk', False) else None
+        self.generation_cache = GenerationCache(path=cache_path, **cache_settings)
+
         # 7. last process
         self.gfw = DFAFilter()
         self.gfw.parse()
-        self.intent = RasaIntent()
+        self.intent = RasaIntent(**self.settings.get('rasa', {}))
+
+        # generations in flight per action, the first acceptable one is used
+        self.speculation = max(1, int(self.settings.get('soul', {}).get('speculation', 1)))
 
         self.take_over = False
         self.temp_talker: wechaty.Contact
@@ -148,14 +225,10 @@ class DramaPlugin(WechatyPlugin):
             self.logger.warning(f"config file url:/{self.config_url} does not have relations.txt. however you can go without it, but it's not recommended!")
 
     def nlu_topic(self, text: [str]) -> list:
-        results = self.uie(text)
-        topics = []
-        for _result in results:
-            topic = {}
-            for key, value in _result.items():
-                topic[key] = set([entity['text'] for entity in value if entity['probability'] > 0.58])
-            topics.append(topic)
-        return topics
+        return self.uie_service.extract(text)
+
+    async def anlu_topic(self, text: [str]) -> list:
+        return await self.uie_service.atopics(text)
 
     def _load_memory(self) -> list:
         """load the memory data"""
@@ -168,12 +241,53 @@ class DramaPlugin(WechatyPlugin):
             self.logger.warning('no data in memory.txt,this is not allowed')
             return self_memory_text
 
-        topics = self.nlu_topic(self_memory_text)
-        self_memory = []
-        for i in range(len(self_memory_text)):
-            self_memory.append({**{"text": self_memory_text[i]}, **topics[i]})
-
-        return self_memory
+        # only the lines and schema keys not in the index yet reach UIE
+        return self.memory_index.load(self_memory_text, self.schema, self.uie_service.extract)
+
+    def _load_self_memory(self) -> IndexedMemory:
+        """the memory.txt items with their index, and their embeddings (cached on disk) when semantic is on"""
+        items = self._load_memory()
+        if not self.semantic or not items:
+            return IndexedMemory(items)
+        vectors = load_vectors(os.path.join(self.file_cache, 'self_memory_vectors.npz'), [item['text'] for item in items],
+                               lambda texts: self.inference.run(embed_texts, texts), stamp=self.semantic.get('model', ''))
+        return IndexedMemory(items, vectors)
+
+    def _user_memory(self, contact_id: str, scenario: str) -> BoundedMemory:
+        """the memory of the user in the scenario, created on first use"""
+        memories = self.user_memory.setdefault(contact_id, {})
+        if scenario not in memories:
+            memories[scenario] = BoundedMemory(**self.user_memory_settings)
+        return memories[scenario]
+
+    def _scenario_schemas(self) -> dict:
+        """
+        the schema subset each (scenario, character) extracts, when its rule column has a FOCUS row
+        (schema keys separated by , or newlines). the keys under which the rule triggers appear in the self memory
+        are added so the rules still fire. characters without FOCUS extract the whole schema
+        """
+        known = {}
+        for _memory in self.self_memory:
+            for shcema in self.schema:
+                for entity in _memory.get(shcema, ()):
+                    known.setdefault(entity, set()).add(shcema)
+
+        subsets = {}
+        for scenario, characters in self.scenarios.items():
+            for character, rules in characters.items():
+                focus = [key.strip() for key in re.split(r'[,，\n]', str(rules.get('FOCUS', ''))) if key.strip()]
+                if not focus:
+                    continue
+                unknown = [key for key in focus if key not in self.schema]
+                if unknown:
+                    self.logger.warning(f'FOCUS of scenario:{scenario}, character:{character} not in focus.json: {unknown}')
+                used = set(focus)
+                for trigger in rules:
+                    used |= known.get(trigger, set())
+                subset = tuple(shcema for shcema in self.schema if shcema in used)
+                if subset:
+                    subsets[(scenario, character)] = subset
+        return subsets
 
     def _load_relations(self) -> dict:
         """load the relations data"""
@@ -272,6 +386,7 @@ class DramaPlugin(WechatyPlugin):
                           "add focus文本 -- add new focus text(xx)\n"
                           "add selfmemory文本 -- add new self memory text(xx)\n"
                           "save -- save the users status and users memory so that game will continue instead of restart\n"
+                          "stats -- show the runtime statistics \n"
                           "take over -- take over the AI for a time \n"
                           "stop take over -- stop the take_over")
             return
@@ -290,8 +405,10 @@ class DramaPlugin(WechatyPlugin):
             if msg.text()[14:] is None:
                 await msg.say("add the focus text close to the code, pls try again")
                 return
-            topics = self.nlu_topic([msg.text()[14:]])
-            self.self_memory.append({**{"text": msg.text()[14:]}, **topics[0]})
+            topics = await self.anlu_topic([msg.text()[14:]])
+            vector = (await self.inference.aembed([msg.text()[14:]]))[0] if self.semantic else None
+            self.self_memory.append({**{"text": msg.text()[14:]}, **topics[0]}, vector)
+            self.memory_index.add(msg.text()[14:].strip(), topics[0], self.schema)
             with open(os.path.join(self.config_url, 'memory.txt'), 'a', encoding='utf-8') as f:
                 f.write(msg.text()[14:] + '\n')
             await msg.say(f"self_memory added new item:{msg.text()[14:]} and memory.txt has been auto updated")
@@ -302,19 +419,25 @@ class DramaPlugin(WechatyPlugin):
                 await msg.say("add the focus text close to the code, pls try again")
                 return
             self.schema.append(msg.text()[9:])
-            self.uie.set_schema(self.schema)
-            self.self_memory = self._load_memory()
+            self.uie_service.set_schema(self.schema)
+            selfmemory = await asyncio.get_running_loop().run_in_executor(None, self._load_self_memory)
+            # give the entity ids of the replaced memory back to the interner
+            self.self_memory.clear()
+            self.self_memory = selfmemory
+            self.scenario_schema = self._scenario_schemas()
             with open(os.path.join(self.config_url, 'focus.json'), 'w', encoding='utf-8') as f:
                 json.dump(self.schema, f, ensure_ascii=False)
             await msg.say("focus updated, and self_memory has been updated. focus.json has been auto updated")
             return
 
         if msg.text().startswith('reload memory'):
-            selfmemory = self._load_memory()
+            selfmemory = await asyncio.get_running_loop().run_in_executor(None, self._load_self_memory)
             if not selfmemory:
                 await msg.say("memory.txt is empty, so I will not change my memory")
             else:
+                self.self_memory.clear()
                 self.self_memory = selfmemory
+                self.scenario_schema = self._scenario_schemas()
                 await msg.say("self memory has been updated.")
             return
 
@@ -324,10 +447,25 @@ class DramaPlugin(WechatyPlugin):
                 await msg.say("scenarios.xlsx is empty, so I will not reload scenarios. No change happened")
             else:
                 self.scenarios = scenarios
+                self.prompt_builder.rebuild(scenarios)
+                self.scenario_schema = self._scenario_schemas()
                 await msg.say("warning: any change of scenarios or characters during program running may cause potentially fatal error！")
                 await msg.say("scenarios has been updated")
             return
 
+        if msg.text().startswith('stats'):
+            await msg.say(f"intent cache: {self.intent.cache.stats()}\n"
+                          f"intent batcher: {self.intent.batcher.stats() if self.intent.batcher else 'off'}\n"
+                          f"yuan scheduler: {get_scheduler().stats()}\n"
+                          f"{self.backend.name} circuit: {self.breaker.stats()}\n"
+                          f"generation cache: {self.generation_cache.stats()}\n"
+                          f"prompt size: {self.prompt_builder.stats()}\n"
+                          f"uie batcher: {self.uie_service.stats()}\n"
+                          f"inference: {self.inference.stats()}\n"
+                          f"user memory: {len(self.user_memory)} users, "
+                          f"{sum(len(m) for memories in self.user_memory.values() for m in memories.values())} items")
+            return
+
         if msg.text().startswith('save'):
             with open(os.path.join(self.config_url, 'users.json'), 'w', encoding='utf-8') as f:
                 json.dump(self.users, f, ensure_ascii=False)
@@ -356,51 +494,144 @@ class DramaPlugin(WechatyPlugin):
         else:
             await msg.say("send help to me to check what you can do")
 
-    async def soul(self, text: str, talker: Contact, scenario: str, character: str, memory: list, last_dialog: str, rules: dict) -> None:
+    async def _submit(self, prompt: str, priority: int) -> str:
+        if not self.breaker.allow():
+            return ''
+        try:
+            reply = await self.backend.generate(prompt, trun="”", priority=priority)
+        except SchedulerFull as e:
+            self.logger.warning(f'generation refused: {e}')
+            return ''
+        except RuntimeWarning as e:
+            self.logger.warning(f'generation failed: {e}')
+            reply = ''
+        except Exception as e:
+            # e.g. a non-json 502 page from a degraded service, or a backend client error
+            self.logger.warning(f'generation failed: {e!r}')
+            reply = ''
+        if not reply or reply == "somethingwentwrongwithyuanservice" or reply == "请求异常，请重试":
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return reply
+
+    async def _fallback(self, prompt: str, rules: dict) -> str:
+        """reply from the fallback backend while the circuit is open"""
+        if self.fallback is not None:
+            try:
+                reply = await self.fallback.generate(prompt, trun="”")
+            except Exception as e:
+                self.logger.warning(f'{self.fallback.name} fallback failed: {e!r}')
+                reply = ''
+            if reply:
+                return reply
+        canned = [line for line in rules.get('FALLBACKREPLY', '').split('\n') if line]
+        return random.choice(canned) if canned else ''
+
+    async def _generate(self, prompt: str, last_dialog: str, rules: dict, cache: bool = False) -> str:
+        """
+        with cache the reply comes from the generation cache when an acceptable one is there, and an acceptable
+        fresh reply is stored for the next user sending the same prompt
+        """
+        if not cache:
+            return await self._generate_fresh(prompt, last_dialog, rules)
+        key = GenerationCache.make_key(*self.backend.fingerprint(prompt, trun="”"))
+        reply = self.generation_cache.get(key)
+        if reply and (len(reply) <= 5 or reply not in last_dialog):
+            return reply
+        reply = await self._generate_fresh(prompt, last_dialog, rules)
+        if reply and not self.breaker.rejecting() and (len(reply) <= 5 or reply not in last_dialog):
+            self.generation_cache.put(key, reply)
+        return reply
+
+    async def _generate_fresh(self, prompt: str, last_dialog: str, rules: dict) -> str:
+        """
+        up to 7 generations until the reply is not a repeat of last_dialog.
+        with speculation > 1 that many generations are in flight at once, the first acceptable reply wins and
+        the rest are cancelled. returns the last usable reply if none was acceptable, '' if all failed.
+        while the backend circuit is open it fails fast to the fallback instead of retrying
+        """
+        if self.breaker.rejecting():
+            return await self._fallback(prompt, rules)
+
+        attempts, reply, pending = 0, '', set()
+        try:
+            while attempts < 7 or pending:
+                while attempts < 7 and len(pending) < self.speculation:
+                    pending.add(asyncio.ensure_future(self._submit(prompt, RETRY if attempts else FIRST)))
+                    attempts += 1
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    candidate = task.result()
+                    if not candidate or candidate == "somethingwentwrongwithyuanservice" or candidate == "请求异常，请重试":
+                        self.logger.warning(f'generation failed, {attempts} submitted so far.')
+                        continue
+                    reply = candidate
+                    if len(candidate) <= 5 or candidate not in last_dialog:
+                        return candidate
+            if not reply and self.breaker.state == CircuitBreaker.OPEN:
+                return await self._fallback(prompt, rules)
+            return reply
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def soul(self, text: str, talker: Contact, scenario: str, character: str, memory: IndexedMemory, last_dialog: str, rules: dict) -> None:
         # 1. understanding: topic information_extraction
-        topics = self.nlu_topic([text, last_dialog])
+        # last_dialog is the utterances of the turn joined, each ends with ”. only the new ones reach UIE
+        utterances = [utterance + '”' for utterance in last_dialog.split('”') if utterance]
+        topics = self.uie_service.acached([text] + utterances, self.scenario_schema.get((scenario, character)))
+        if self.semantic:
+            # the message is the query, last_dialog is stored with the memory item
+            topics, vectors = await asyncio.gather(topics, self.inference.aembed([text, last_dialog]))
+        else:
+            topics, vectors = await topics, [None, None]
         if topics[0]:
             topic = topics[0]
         else:
-            topic = topics[1]
+            topic = self.uie_service.merge(topics[1:])
         self.logger.info(f"topics:{topic}")
 
         # 2. memory reading
+        # both memories are looked up through their (schema, entity) index
         selfmemory_text = ''
         if topic:
             for shcema in self.schema:
                 if not topic.get(shcema, []):
                     continue
-                for _memory in self.self_memory:
-                    if topic[shcema].intersection(_memory.get(shcema, set())):
-                        selfmemory_text += _memory['text']
+                for i in self.self_memory.matching(shcema, topic[shcema]):
+                    selfmemory_text += self.self_memory.get(i).text
                 if selfmemory_text:
                     break
+        if not selfmemory_text and self.semantic:
+            for i in self.self_memory.similar(vectors[0], self.semantic.get('top_k', 3), self.semantic.get('min_score', 0.6)):
+                selfmemory_text += self.self_memory.get(i).text
 
         memory_text = ''
         if topic:
             for shcema in self.schema:
                 if not topic.get(shcema, []):
                     continue
-                for i in range(len(memory)-1, -1, -1):
-                    if topic[shcema].intersection(memory[i].get(shcema, set())):
-                        memory_text = memory[i]['text'] + memory_text
-                        if len(memory_text) >= 150:
-                            break
+                for i in reversed(memory.matching(shcema, topic[shcema])):
+                    memory_text = memory.get(i).text + memory_text
+                    if len(memory_text) >= 150:
+                        break
                 if memory_text:
                     break
+        if not memory_text and self.semantic:
+            for i in reversed(memory.similar(vectors[0], self.semantic.get('top_k', 3), self.semantic.get('min_score', 0.6))):
+                memory_text = memory.get(i).text + memory_text
+                if len(memory_text) >= 150:
+                    break
 
         if len(memory_text) < 50:
-            for i in range(len(memory)-1, -1, -1):
-                memory_text = memory[i]['text'] + memory_text
+            for _memory in reversed(memory):
+                memory_text = _memory.text + memory_text
                 if len(memory_text) >= 50:
                     break
 
         # 3. combine to the pre_prompt
-        if memory_text:
-            pre_prompt = self.relations.get("你", "") + self.relations.get(character, '') + selfmemory_text + rules.get('DESCRIPTIONTEXT', '') + '刚才' + memory_text + '，现在' + last_dialog + "你"
-        else:
-            pre_prompt = self.relations.get("你", "") + self.relations.get(character, '') + selfmemory_text + rules.get('DESCRIPTIONTEXT', '') + last_dialog + "你"
+        pre_prompt = self.prompt_builder.build(scenario, character, rules, selfmemory_text, memory_text, last_dialog)
 
         # 4. act the action in sequence
         actions = []
@@ -419,6 +650,9 @@ class DramaPlugin(WechatyPlugin):
 
         replies = []
         for action in actions:
+            cache = bool(rules.get('CACHEABLE'))
+            if action.startswith('CACHE'):
+                action, cache = action[5:], True
             if action.startswith('SOLID'):
                 reply = action[5:]
             elif action.startswith('TRANS'):
@@ -429,11 +663,11 @@ class DramaPlugin(WechatyPlugin):
                     self.last_turn_memory[talker.contact_id][action[5:]][character]["text"] = [f"你说：“{next_rules['WELCOMEWORD']}”"]
                     self.last_turn_memory[talker.contact_id][action[5:]][character]["talker"] = ["你"]
                     if topic:
-                        memory.append({**{"text": last_dialog}, **topic})
+                        memory.append({**{"text": last_dialog}, **topic}, vectors[1])
                 return
             elif action.startswith('HOLD'):
                 try:
-                    time.sleep(int(action[4:]))
+                    await asyncio.sleep(int(action[4:]))
                     self.logger.info(f"HOlD {action[4:]}s as editor wish")
                 except ValueError:
                     self.logger.info(f"may the action format wrong, scenario:{scenario}, characters:{character}, action: {action}")
@@ -444,13 +678,7 @@ class DramaPlugin(WechatyPlugin):
             else:
                 prompt = pre_prompt + action + "说：“"
                 self.logger.info(prompt)
-                for i in range(7):
-                    reply = self.yuan.submit_API(prompt, trun="”")
-                    if not reply or reply == "somethingwentwrongwithyuanservice" or reply == "请求异常，请重试":
-                        self.logger.warning(f'generation failed {str(i+1)} times.')
-                        continue
-                    if len(reply) <= 5 or reply not in last_dialog:
-                        break
+                reply = await self._generate(prompt, last_dialog, rules, cache=cache)
 
                 if not reply or reply == "somethingwentwrongwithyuanservice" or reply == "请求异常，请重试":
                     self.logger.warning(f'Yuan may out of service, {reply}')
@@ -463,7 +691,7 @@ class DramaPlugin(WechatyPlugin):
         self.logger.info("----------------------------\n")
 
         # 5. memory saving
-        memory.append({**{"text": last_dialog}, **topic})
+        memory.append({**{"text": last_dialog}, **topic}, vectors[1])
         self.last_turn_memory[talker.contact_id][scenario][character]["text"] = [f"你说：“{'。'.join(replies)}”"]
         self.last_turn_memory[talker.contact_id][scenario][character]["talker"] = ["你"]
 
@@ -479,7 +707,7 @@ class DramaPlugin(WechatyPlugin):
             file_box = await msg.to_file_box()
             saved_file = os.path.join(self.file_cache, f"silk_{talker.contact_id}.silk")
             await file_box.to_file(saved_file, overwrite=True)
-            text = asr(talker=talker.contact_id, input_silk=saved_file, cache_url=self.file_cache)
+            text = await self.inference.aasr(talker.contact_id, saved_file, self.file_cache)
             self.logger.info(f"语音识别结果: {text}")
             if text == '######':
                 await msg.say("抱歉，没听清呢，您还是打字好么？或者再说一遍吧")
@@ -502,7 +730,6 @@ class DramaPlugin(WechatyPlugin):
         """
         if talker.contact_id not in self.users:
             self.users[talker.contact_id] = ['陌生人', 'welcome']
-            self.user_memory[talker.contact_id] = dict.fromkeys(self.scenarios.keys(), [])
             with open(os.path.join(self.file_cache, 'last_turn_memory_template.json'), 'r', encoding='utf-8') as f:
                 self.last_turn_memory[talker.contact_id] = json.load(f)
             """
@@ -539,8 +766,9 @@ class DramaPlugin(WechatyPlugin):
         text = text.strip().replace('\n', '，')
         self.logger.info(f"processed text:{text}")
 
-        if self.gfw.filter(text):
-            self.logger.info(f'{text} is filtered, for the reason of {self.gfw.filter(text)}')
+        sensitive = self.gfw.filter(text)
+        if sensitive:
+            self.logger.info(f'{text} is filtered, for the reason of {sensitive}')
             await msg.say('请勿发表不当言论，谢谢配合')
             return
 
@@ -569,8 +797,8 @@ class DramaPlugin(WechatyPlugin):
 
         # 7. AI process
         rules = self.scenarios[scenario].get(character, {})
-        memory = self.user_memory[talker.contact_id][scenario]
-        intent, conf = self.intent.predict(text)
+        memory = self._user_memory(talker.contact_id, scenario)
+        intent, conf = await self.intent.apredict(text)
         self.logger.info(f"intent:{intent}, confidence:{conf}")
         """
         for Rasa cannot guarantee precision at this stage, we need to partially correct the intent,
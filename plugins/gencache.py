@@ -0,0 +1,69 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+
+class GenerationCache:
+    """
+    cache of generated replies keyed by a hash of (engine, full query, sampling params), for the prompts that come out
+    byte-identical across users such as scenario openings. bounded LRU in memory with TTL, optionally backed by a
+    sqlite file so popular replies survive restarts
+    """
+    def __init__(self, maxsize: int = 2048, ttl: float = 86400.0, path: Optional[str] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS replies (key TEXT PRIMARY KEY, reply TEXT, created REAL)')
+            self._db.execute('DELETE FROM replies WHERE created < ?', (time.time() - ttl,))
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None and self._db is not None:
+            row = self._db.execute('SELECT reply, created FROM replies WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                item = tuple(row)
+                self._remember(key, item)
+        if item is None or time.time() - item[1] > self.ttl:
+            if item is not None:
+                self._forget(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: str, reply: str) -> None:
+        item = (reply, time.time())
+        self._remember(key, item)
+        if self._db is not None:
+            self._db.execute('INSERT OR REPLACE INTO replies VALUES (?, ?, ?)', (key, *item))
+
+    def _remember(self, key: str, item: tuple) -> None:
+        self._data[key] = item
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def _forget(self, key: str) -> None:
+        self._data.pop(key, None)
+        if self._db is not None:
+            self._db.execute('DELETE FROM replies WHERE key = ?', (key,))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0, 'disk': self._db is not None}
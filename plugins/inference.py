@@ -0,0 +1,153 @@
+import os
+import wave
+import asyncio
+import tempfile
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+# models of the current worker, loaded once by _init_worker
+_models = {}
+
+
+def _init_worker(uie: Optional[dict], asr: bool, embedding: Optional[dict] = None) -> None:
+    """load and warm up the models, so the first real request does not pay for it"""
+    if embedding:
+        from plugins.semantic import Embedder
+        _models['embedder'] = Embedder(**embedding)
+        _models['embedder'](['预热'])
+    if uie:
+        _models['uie_config'] = uie
+        taskflow = _new_predictor(tuple(uie['schema']))
+        taskflow(['预热'])
+        _models['uie'] = taskflow
+        _models['uie_schema'] = tuple(uie['schema'])
+    if asr:
+        from plugins.paddleasr import get_asr_model
+        model = get_asr_model()
+        with tempfile.TemporaryDirectory() as tmp:
+            silence = os.path.join(tmp, 'warmup.wav')
+            with wave.open(silence, 'wb') as f:
+                f.setnchannels(1)
+                f.setsampwidth(2)
+                f.setframerate(16000)
+                f.writeframes(b'\x00\x00' * 8000)
+            try:
+                model(silence, force_yes=True)
+            except Exception as e:
+                print(f'asr warmup failed: {e!r}')
+
+
+def _ping() -> None:
+    pass
+
+
+def _new_predictor(schema: tuple):
+    """
+    mode taskflow: the PaddleNLP Taskflow of the checkpoint.
+    mode onnx: the exported (int8) model on onnxruntime, see plugins.uieonnx. num_threads per predictor in both
+    """
+    config = _models['uie_config']
+    task_path = config.get('task_path', 'uie/checkpoint/model_best')
+    num_threads = config.get('num_threads')
+    if config.get('mode', 'taskflow') == 'onnx':
+        from plugins.uieonnx import UIEOnnxPredictor
+        return UIEOnnxPredictor(config.get('onnx_model', 'uie/export/inference.int8.onnx'), list(schema),
+                                tokenizer_path=task_path, num_threads=num_threads or 1)
+    from paddlenlp import Taskflow
+    kwargs = {'num_threads': num_threads} if num_threads else {}
+    return Taskflow('information_extraction', schema=list(schema), task_path=task_path, **kwargs)
+
+
+def _predictor(schema: tuple):
+    """
+    the one predictor of the worker, switched to the schema subset of the batch. a worker runs one job at a time
+    and set_schema only rebuilds the schema tree, so every subset shares a single copy of the model weights
+    """
+    taskflow = _models['uie']
+    if _models['uie_schema'] != schema:
+        taskflow.set_schema(list(schema))
+        _models['uie_schema'] = schema
+    return taskflow
+
+
+def uie_topics(schema: tuple, texts: list, threshold: float) -> list:
+    """UIE topics of texts as {schema key: set of entities}, runs in the worker"""
+    taskflow = _predictor(schema)
+    topics = []
+    for _result in taskflow(texts):
+        topic = {}
+        for key, value in _result.items():
+            topic[key] = set([entity['text'] for entity in value if entity['probability'] > threshold])
+        topics.append(topic)
+    return topics
+
+
+def embed_texts(texts: list):
+    """normalized embeddings of texts as a float32 matrix, runs in the worker"""
+    return _models['embedder'](texts)
+
+
+def speech_to_text(talker: str, input_silk: str, cache_url: str) -> str:
+    """silk decode, ffmpeg and ASR of a voice message, runs in the worker"""
+    from plugins.paddleasr import asr
+    return asr(talker=talker, input_silk=input_silk, cache_url=cache_url)
+
+
+class InferenceExecutor:
+    """
+    runs the CPU heavy model work (UIE, ASR with its ffmpeg call) away from the event loop.
+    workers > 0: a process pool, every process loads and warms up its own models at start, so model work
+    scales across cores. workers = 0: one thread in this process, for machines that can't afford a model copy per core.
+    at most max_queue jobs are handed to the pool at a time, further callers wait their turn
+    """
+    def __init__(self, uie: Optional[dict] = None, asr: bool = True, workers: int = 0, max_queue: int = 32,
+                 embedding: Optional[dict] = None) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.done = 0
+        if workers > 0:
+            # spawn, paddle does not survive a fork of a process that already started its threads
+            self._pool = ProcessPoolExecutor(workers, mp_context=get_context('spawn'),
+                                             initializer=_init_worker, initargs=(uie, asr, embedding))
+        else:
+            self._pool = ThreadPoolExecutor(1, thread_name_prefix='inference',
+                                            initializer=_init_worker, initargs=(uie, asr, embedding))
+        # start the workers now instead of on the first message
+        for _ in range(max(workers, 1)):
+            self._pool.submit(_ping)
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def run(self, fn, *args):
+        """blocking call, for loading at startup"""
+        return self._pool.submit(fn, *args).result()
+
+    async def arun(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_queue)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            return await asyncio.wrap_future(self._pool.submit(fn, *args))
+        finally:
+            self.in_flight -= 1
+            self.done += 1
+            self._slots.release()
+
+    async def aembed(self, texts: list):
+        return await self.arun(embed_texts, texts)
+
+    async def aasr(self, talker: str, input_silk: str, cache_url: str) -> str:
+        return await self.arun(speech_to_text, talker, input_silk, cache_url)
+
+    def stats(self) -> dict:
+        return {'workers': self.workers, 'in_flight': self.in_flight, 'waiting': self.waiting, 'done': self.done}
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
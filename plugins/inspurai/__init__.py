@@ -1,10 +1,16 @@
 import sys
 import os
 from .inspurai import Example, Yuan
+from .url_config import YuanTransport, set_transport
+from .scheduler import YuanScheduler, set_scheduler
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 
 __all__ = [
     Example,
     Yuan,
+    YuanTransport,
+    set_transport,
+    YuanScheduler,
+    set_scheduler,
 ]
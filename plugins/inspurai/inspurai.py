@@ -4,7 +4,8 @@
 # import json
 import os
 import uuid
-from plugins.inspurai.url_config import submit_request, reply_request
+from plugins.inspurai.url_config import submit_request, reply_request, async_submit_request, async_reply_request
+from plugins.inspurai.scheduler import get_scheduler, FIRST
 
 
 def set_yuan_account(user, phone):
@@ -73,6 +74,7 @@ class Yuan:
         self.output_suffix = output_suffix
         self.append_output_prefix_to_query = append_output_prefix_to_query
         self.stop = (output_suffix + input_prefix).strip()
+        self._prime_text = None
 
         # if self.engine not in ['base_10B','translate','dialog']:
         #     raise Exception('engine must be one of [\'base_10B\',\'translate\',\'dialog\'] ')
@@ -82,11 +84,13 @@ class Yuan:
         Example must be an instance of the Example class."""
         assert isinstance(ex, Example), "Please create an Example object."
         self.examples[ex.get_id()] = ex
+        self._prime_text = None
 
     def delete_example(self, id):
         """Delete example with the specific id."""
         if id in self.examples:
             del self.examples[id]
+            self._prime_text = None
 
     def get_example(self, id):
         """Get a single example."""
@@ -97,9 +101,11 @@ class Yuan:
         return {k: v.as_dict() for k, v in self.examples.items()}
 
     def get_prime_text(self):
-        """Formats all examples to prime the model."""
-        return "".join(
-            [self.format_example(ex) for ex in self.examples.values()])
+        """Formats all examples to prime the model, cached until the examples change."""
+        if self._prime_text is None:
+            self._prime_text = "".join(
+                [self.format_example(ex) for ex in self.examples.values()])
+        return self._prime_text
 
     def get_engine(self):
         """Returns the engine specified for the API."""
@@ -150,6 +156,21 @@ class Yuan:
         
         return response_text
 
+    async def aresponse(self,
+                        query,
+                        engine='base_10B',
+                        max_tokens=20,
+                        temperature=0.9,
+                        topP=0.1,
+                        topK=1,
+                        frequencyPenalty=1.0,
+                        responsePenalty=1.0,
+                        noRepeatNgramSize=0):
+        """Obtains the original result returned by the API without blocking the event loop."""
+        requestId = await async_submit_request(query, temperature, topP, topK, max_tokens, engine, frequencyPenalty,
+                                               responsePenalty, noRepeatNgramSize)
+        return await async_reply_request(requestId)
+
     def del_special_chars(self, msg):
         special_chars = ['<unk>', '<eod>', '#', '▃', '▁', '▂', '　']
         for char in special_chars:
@@ -169,6 +190,27 @@ class Yuan:
                             frequencyPenalty = self.frequencyPenalty,
                             responsePenalty = self.responsePenalty,
                             noRepeatNgramSize = self.noRepeatNgramSize)
+        return self._post_process(res, trun)
+
+    async def asubmit_API(self, prompt, trun='▃', priority=FIRST):
+        """asyncio version of submit_API, rate limited by the process-wide scheduler.
+        :prompt: Question or any content a user may input.
+        :priority: scheduler priority, FIRST for the first reply of a turn, RETRY for regenerations.
+        :return: pure text response."""
+        await get_scheduler().acquire(priority)
+        query = self.craft_query(prompt)
+        res = await self.aresponse(query, engine=self.engine,
+                                   max_tokens=self.max_tokens,
+                                   temperature=self.temperature,
+                                   topP=self.topP,
+                                   topK=self.topK,
+                                   frequencyPenalty=self.frequencyPenalty,
+                                   responsePenalty=self.responsePenalty,
+                                   noRepeatNgramSize=self.noRepeatNgramSize)
+        return self._post_process(res, trun)
+
+    def _post_process(self, res, trun):
+        """turn the raw API result into the pure text reply"""
         if 'resData' in res and res['resData']:
             txt = res['resData']
         else:
@@ -0,0 +1,112 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+FIRST = 0
+RETRY = 1
+
+
+class SchedulerFull(RuntimeWarning):
+    """the request was refused locally, nothing reached the Yuan service"""
+
+
+class YuanScheduler:
+    """
+    process-wide token bucket in front of the Yuan generations, so many active users share the account quota
+    instead of each firing its retries at once.
+    rate: generations per second, burst: bucket size, max_queue: waiting requests before new ones are refused.
+    waiting requests are granted by priority (FIRST before RETRY), in arrival order within a priority.
+    when the queue is full a request pushes out the newest waiter of a lower priority, and is refused if there is none
+    """
+    def __init__(self, rate=2.0, burst=4, max_queue=64):
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._queue = []
+        self._seq = itertools.count()
+        self._timer = None
+
+        self.granted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority=FIRST):
+        """wait for a generation slot, raises SchedulerFull when the queue is full or this waiter was pushed out"""
+        self._refill()
+        if not self._queue and self._tokens >= 1:
+            self._tokens -= 1
+            self._record(0.0)
+            return
+
+        if self.queue_depth() >= self.max_queue:
+            # make room by dropping the newest of the lowest priority waiters, if they rank below this request
+            waiting = [entry for entry in self._queue if not entry[2].done()]
+            victim = max(waiting, key=lambda entry: entry[:2]) if waiting else None
+            self.rejected += 1
+            if victim is None or victim[0] <= priority:
+                raise SchedulerFull(f'yuan scheduler queue is full ({self.max_queue} waiting)')
+            victim[2].set_exception(SchedulerFull('yuan scheduler queue is full, dropped for a higher priority request'))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._schedule()
+        start = time.monotonic()
+        await future
+        self._record(time.monotonic() - start)
+
+    def _record(self, wait):
+        self.granted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def _schedule(self):
+        """arm a timer for the moment the next token is available"""
+        if self._timer is None and self._queue:
+            delay = max(0.0, (1 - self._tokens) / self.rate)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+        while self._queue and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                # the waiter was cancelled
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        while self._queue and self._queue[0][2].done():
+            heapq.heappop(self._queue)
+        self._schedule()
+
+    def queue_depth(self):
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def stats(self):
+        return {'queue_depth': self.queue_depth(), 'granted': self.granted, 'rejected': self.rejected,
+                'mean_wait': self.total_wait / self.granted if self.granted else 0.0, 'max_wait': self.max_wait}
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = YuanScheduler()
+    return _scheduler
+
+
+def set_scheduler(scheduler):
+    """replace the process-wide scheduler, e.g. set_scheduler(YuanScheduler(rate=5, burst=10))"""
+    global _scheduler
+    _scheduler = scheduler
@@ -1,8 +1,12 @@
 import requests
+import aiohttp
+import asyncio
 import hashlib
 import time
 import json
 import os
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 ACCOUNT = ''
 PHONE = ''
@@ -19,25 +23,108 @@ def code_md5(str):
     return result
 
 
+class YuanTransport:
+    """
+    pooled keep-alive transport shared by every Yuan request of the process:
+    a requests.Session for the sync API, an aiohttp session for the async one (created inside the running loop),
+    the md5 token cached per account and calendar day, configurable connect/read timeouts and retry policy.
+    only connection failures are retried, a submit that reached the server is never sent twice
+    """
+    def __init__(self,
+                 connect_timeout=5,
+                 read_timeout=30,
+                 retries=2,
+                 backoff_factor=0.3,
+                 pool_size=32):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                              max_retries=Retry(total=retries, connect=retries, read=0, status=0,
+                                                backoff_factor=backoff_factor))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.verify = False
+
+        self._async_session = None
+        self._token_key = None
+        self._headers = None
+
+    def headers(self):
+        """token header, recomputed only when the account or the day changes"""
+        global ACCOUNT, PHONE
+        key = (os.environ.get('YUAN_ACCOUNT'), time.strftime("%Y-%m-%d", time.localtime()))
+        if key != self._token_key:
+            ACCOUNT, PHONE = key[0].split('||')
+            self._headers = {'token': code_md5(ACCOUNT + PHONE + key[1])}
+            self._token_key = key
+        return self._headers
+
+    def get(self, url, header, timeout=None, show_error=False):
+        try:
+            return self.session.get(url, headers=header, timeout=(self.connect_timeout, timeout or self.read_timeout))
+        except Exception as exception:
+            if show_error:
+                print(exception)
+            return None
+
+    def async_session(self):
+        if self._async_session is None or self._async_session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ssl=False)
+            self._async_session = aiohttp.ClientSession(connector=connector)
+        return self._async_session
+
+    async def aget(self, url, header, timeout=None, show_error=False):
+        """returns the response text, or None when every attempt failed"""
+        client_timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=timeout or self.read_timeout)
+        for attempt in range(self.retries + 1):
+            try:
+                async with self.async_session().get(url, headers=header, timeout=client_timeout) as response:
+                    return await response.text()
+            except aiohttp.ClientConnectorError as exception:
+                if attempt == self.retries:
+                    if show_error:
+                        print(exception)
+                    return None
+                await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+            except Exception as exception:
+                if show_error:
+                    print(exception)
+                return None
+
+    async def aclose(self):
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+
+
+_transport = None
+
+
+def get_transport():
+    global _transport
+    if _transport is None:
+        _transport = YuanTransport()
+    return _transport
+
+
+def set_transport(transport):
+    """replace the process-wide transport, e.g. set_transport(YuanTransport(read_timeout=20, retries=3))"""
+    global _transport
+    _transport = transport
+
+
 def rest_get(url, header, timeout, show_error=False):
     #Call rest get method
-    try:
-        response = requests.get(url, headers=header, timeout=timeout, verify=False)
-        return response
-    except Exception as exception:
-        if show_error:
-            print(exception)
-        return None
+    return get_transport().get(url, header, timeout, show_error)
 
 
 def header_generation():
     """Generate header for API request."""
-    t = time.strftime("%Y-%m-%d", time.localtime())
-    global ACCOUNT, PHONE
-    ACCOUNT, PHONE = os.environ.get('YUAN_ACCOUNT').split('||')
-    token = code_md5(ACCOUNT+PHONE+t)
-    headers = {'token': token}
-    return headers
+    return get_transport().headers()
 
 
 def submit_request(query, temperature, topP, topK, max_tokens, engine, frequencyPenalty, responsePenalty, noRepeatNgramSize):
@@ -69,3 +156,60 @@ def reply_request(requestId, cycle_count=5):
             raise RuntimeWarning(response_text)
         time.sleep(3)
     return response_text
+
+
+async def async_rest_get(url, header, timeout, show_error=False):
+    #Call rest get method without blocking the event loop, returns the response text
+    return await get_transport().aget(url, header, timeout, show_error)
+
+
+def _decode_response(text: str, what: str) -> dict:
+    """the json body of an API response, RuntimeWarning when it is not one (e.g. the html page of a gateway error)"""
+    try:
+        response_text = json.loads(text)
+        response_text["flag"], response_text["resData"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise RuntimeWarning({"flag": False, "resData": None, "errMessage": f"{what} returned an invalid response: {e!r}"})
+    return response_text
+
+
+async def async_submit_request(query, temperature, topP, topK, max_tokens, engine, frequencyPenalty, responsePenalty, noRepeatNgramSize):
+    """Submit query to the backend server and get requestID, asyncio version."""
+    headers = header_generation()
+    url = SUBMIT_URL + "engine={0}&account={1}&data={2}&temperature={3}&topP={4}&topK={5}&tokensToGenerate={6}" \
+                     "&type={7}&frequencyPenalty={8}&responsePenalty={9}&noRepeatNgramSize={10}".\
+        format(engine, ACCOUNT, query, temperature, topP, topK, max_tokens, "api", frequencyPenalty, responsePenalty, noRepeatNgramSize)
+    text = await async_rest_get(url, headers, 30)
+    if text is None:
+        raise RuntimeWarning({"flag": False, "resData": None, "errMessage": "submit request failed"})
+    response_text = _decode_response(text, "submit request")
+    if response_text["flag"]:
+        requestId = response_text["resData"]
+        return requestId
+    else:
+        raise RuntimeWarning(response_text)
+
+
+async def async_reply_request(requestId, timeout=15, first_delay=0.3, backoff=1.6, max_delay=3):
+    """
+    Check reply API to get the inference response, asyncio version.
+    polls with adaptive backoff (first_delay growing by backoff up to max_delay) within the same 15s budget
+    the fixed 5 x 3s polling had, so short generations come back after a few hundred ms instead of 3s
+    """
+    url = REPLY_URL + "account={0}&requestId={1}".format(ACCOUNT, requestId)
+    headers = header_generation()
+    response_text = {"flag": True, "resData": None}
+    deadline = time.monotonic() + timeout
+    delay = first_delay
+    while True:
+        await asyncio.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        text = await async_rest_get(url, headers, 30, show_error=True)
+        if text is not None:
+            response_text = _decode_response(text, "reply request")
+            if response_text["resData"]:
+                return response_text
+        if time.monotonic() >= deadline:
+            if response_text["flag"] is False:
+                raise RuntimeWarning(response_text)
+            return response_text
+        delay = min(delay * backoff, max_delay)
@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+
+
+class SelfMemoryIndex:
+    """
+    UIE topics of the memory.txt lines persisted on disk as {schema key: {line sha1: [entities]}},
+    so a restart or `reload memory` only extracts new or changed lines, and `add focus` only extracts the new key.
+    `stamp` identifies the model and threshold the topics came from, the index starts over when it changes
+    """
+    def __init__(self, path: str, stamp: str = '') -> None:
+        self.path = path
+        self.stamp = stamp
+        self.topics = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('stamp') == stamp:
+                    self.topics = data.get('topics', {})
+            except (OSError, ValueError):
+                self.topics = {}
+
+    @staticmethod
+    def line_key(line: str) -> str:
+        return hashlib.sha1(line.encode('utf-8')).hexdigest()
+
+    def load(self, lines: list, schema: list, extract) -> list:
+        """
+        memory items {"text": line, schema key: set of entities} of lines.
+        extract(texts, schema) -> topics runs UIE on the missing (line, key) pairs only, grouped by the missing keys
+        """
+        keys = [self.line_key(line) for line in lines]
+        groups = {}
+        for i, key in enumerate(keys):
+            missing = tuple(name for name in schema if key not in self.topics.get(name, {}))
+            if missing:
+                groups.setdefault(missing, []).append(i)
+        for missing, indexes in groups.items():
+            results = extract([lines[i] for i in indexes], list(missing))
+            for i, topic in zip(indexes, results):
+                for name in missing:
+                    self.topics.setdefault(name, {})[keys[i]] = sorted(topic.get(name, ()))
+
+        if groups or self._prune(keys, schema):
+            self.save()
+
+        memory = []
+        for line, key in zip(lines, keys):
+            item = {"text": line}
+            for name in schema:
+                entities = self.topics[name][key]
+                if entities:
+                    item[name] = set(entities)
+            memory.append(item)
+        return memory
+
+    def add(self, line: str, topic: dict, schema: list) -> None:
+        """record the topics of a line extracted elsewhere, e.g. by `add selfmemory`"""
+        key = self.line_key(line)
+        for name in schema:
+            self.topics.setdefault(name, {})[key] = sorted(topic.get(name, ()))
+        self.save()
+
+    def _prune(self, keys: list, schema: list) -> bool:
+        """drop the lines and keys no longer in use, returns whether anything was dropped"""
+        alive = set(keys)
+        pruned = False
+        for name in list(self.topics):
+            if name not in schema:
+                del self.topics[name]
+                pruned = True
+                continue
+            stale = [key for key in self.topics[name] if key not in alive]
+            for key in stale:
+                del self.topics[name][key]
+            pruned = pruned or bool(stale)
+        return pruned
+
+    def save(self) -> None:
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'stamp': self.stamp, 'topics': self.topics}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,254 @@
+import threading
+from array import array
+from typing import Optional
+
+
+class EntityInterner:
+    """
+    process-wide table (schema key, entity) -> small int, so an entity mentioned by thousands of contacts
+    is stored once and memory entries only hold ints.
+    ids are reference counted by the memories holding them, an id nobody holds anymore is dropped and reused
+    for the next new pair, so the table follows the live memories instead of every entity ever seen.
+    intern_acquire hands out an id together with its reference, so a release on another thread can't recycle it
+    before it is held
+    """
+    def __init__(self) -> None:
+        self._ids = {}
+        self._pairs = []
+        self._refs = []
+        self._free = []
+        self._lock = threading.Lock()
+
+    def intern_acquire(self, key: str, entity: str) -> int:
+        """the id of the pair, interned if new, with one reference taken for the caller"""
+        with self._lock:
+            pid = self._ids.get((key, entity))
+            if pid is None:
+                if self._free:
+                    pid = self._free.pop()
+                    self._pairs[pid] = (key, entity)
+                else:
+                    pid = len(self._pairs)
+                    self._pairs.append((key, entity))
+                    self._refs.append(0)
+                self._ids[(key, entity)] = pid
+            self._refs[pid] += 1
+        return pid
+
+    def acquire(self, pids) -> None:
+        with self._lock:
+            for pid in pids:
+                self._refs[pid] += 1
+
+    def release(self, pids) -> None:
+        with self._lock:
+            for pid in pids:
+                self._refs[pid] -= 1
+                if self._refs[pid] == 0:
+                    del self._ids[self._pairs[pid]]
+                    self._pairs[pid] = None
+                    self._free.append(pid)
+
+    def lookup(self, key: str, entity: str) -> Optional[int]:
+        """the id of a pair already interned, None for unseen pairs (which no entry can hold)"""
+        return self._ids.get((key, entity))
+
+    def pair(self, pid: int) -> tuple:
+        return self._pairs[pid]
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+ENTITIES = EntityInterner()
+
+
+class MemoryEntry:
+    """a memory item: its text and the sorted interned ids of its (schema key, entity) pairs"""
+    __slots__ = ('text', 'entities')
+
+    def __init__(self, text: str, entities: array) -> None:
+        self.text = text
+        self.entities = entities
+
+    @classmethod
+    def from_topic(cls, text: str, topic: dict) -> 'MemoryEntry':
+        """
+        from {schema key: set of entities} as UIE topics come, a "text" key in topic is ignored.
+        the entry holds a reference to each of its ids, hand it to IndexedMemory._put(..., held=True)
+        """
+        pairs = {(key, entity) for key, entities in topic.items() if key != 'text' for entity in entities}
+        return cls(text, array('I', sorted(ENTITIES.intern_acquire(key, entity) for key, entity in pairs)))
+
+    def get(self, key: str, default=()) -> set:
+        """the entities under key, decoded"""
+        found = {ENTITIES.pair(pid)[1] for pid in self.entities if ENTITIES.pair(pid)[0] == key}
+        return found or default
+
+    def topic(self) -> dict:
+        topic = {}
+        for pid in self.entities:
+            key, entity = ENTITIES.pair(pid)
+            topic.setdefault(key, set()).add(entity)
+        return topic
+
+
+class IndexedMemory:
+    """
+    MemoryEntry items with an inverted index interned (schema key, entity) id -> item ids,
+    kept up to date on append and remove, so retrieval costs the matched entities instead of a scan of every item.
+    ids grow with insertion, ascending ids are the chronological order.
+    with semantic retrieval on, the items also get a row in an EmbeddingMatrix (plugins.semantic)
+    """
+    def __init__(self, items=(), vectors=None) -> None:
+        self._items = {}
+        self._index = {}
+        self._next_id = 0
+        self.vectors = None
+        for i, item in enumerate(items):
+            self.append(item, None if vectors is None else vectors[i])
+
+    def append(self, item, vector=None) -> int:
+        """item: a MemoryEntry or a {"text": ..., schema key: set of entities} dict"""
+        held = isinstance(item, dict)
+        if held:
+            item = MemoryEntry.from_topic(item['text'], item)
+        item_id = self._next_id
+        self._next_id += 1
+        self._put(item_id, item, vector, held)
+        return item_id
+
+    def _put(self, item_id: int, item: MemoryEntry, vector=None, held: bool = False) -> None:
+        """held: the references of item's ids were already taken for this memory, e.g. by from_topic"""
+        self._items[item_id] = item
+        if vector is not None:
+            if self.vectors is None:
+                from plugins.semantic import EmbeddingMatrix
+                self.vectors = EmbeddingMatrix(len(vector))
+            self.vectors.add(item_id, vector)
+        if not held:
+            ENTITIES.acquire(item.entities)
+        for pid in item.entities:
+            self._index.setdefault(pid, set()).add(item_id)
+
+    def remove(self, item_id: int) -> None:
+        item = self._items.pop(item_id)
+        if self.vectors is not None:
+            self.vectors.remove(item_id)
+        for pid in item.entities:
+            ids = self._index[pid]
+            ids.discard(item_id)
+            if not ids:
+                del self._index[pid]
+        ENTITIES.release(item.entities)
+
+    def clear(self) -> None:
+        """drop every item, giving back their entity ids"""
+        for item_id in list(self._items):
+            self.remove(item_id)
+
+    def matching(self, key: str, entities) -> list:
+        """ids of the items holding any of entities under key, oldest first"""
+        ids = set()
+        for entity in entities:
+            pid = ENTITIES.lookup(key, entity)
+            if pid is not None:
+                ids |= self._index.get(pid, set())
+        return sorted(ids)
+
+    def similar(self, vector, k: int = 3, min_score: float = 0.0) -> list:
+        """ids of the k items closest to vector with cosine >= min_score, oldest first"""
+        if self.vectors is None:
+            return []
+        return sorted(item_id for item_id, _ in self.vectors.search(vector, k, min_score)[0])
+
+    def get(self, item_id: int) -> MemoryEntry:
+        return self._items[item_id]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __reversed__(self):
+        return reversed(self._items.values())
+
+
+class BoundedMemory(IndexedMemory):
+    """
+    per-user, per-scenario conversation memory bounded by item count and total characters.
+    the oldest turns evicted to stay in bounds are folded into one digest item (id -1, so it stays the oldest):
+    the tail of their text up to digest_chars and their topic sets, each key capped to the digest_entities
+    most recent entities. chars, the digest included, stays within max_chars unless the newest turn alone
+    is longer. memory use stays flat however long the user talks
+    """
+    DIGEST = -1
+
+    def __init__(self, max_items: int = 50, max_chars: int = 3000, digest_chars: int = 100, digest_entities: int = 32) -> None:
+        self.max_items = max_items
+        self.max_chars = max_chars
+        # at most half the budget, so the digest never crowds out the recent turns
+        self.digest_chars = min(digest_chars, max_chars // 2)
+        self.digest_entities = digest_entities
+        self.chars = 0
+        self.compacted = 0
+        super().__init__()
+
+    def append(self, item, vector=None) -> int:
+        item_id = super().append(item, vector)
+        self.chars += len(self._items[item_id].text)
+        # the evicted text grows the digest up to digest_chars, count it in the total
+        digest_chars = len(self._items[self.DIGEST].text) if self.DIGEST in self._items else 0
+        turns, turn_chars = self._turns(), self.chars - digest_chars
+        evicted = []
+        for oldest in self._items:
+            if turns <= self.max_items and turn_chars + min(digest_chars, self.digest_chars) <= self.max_chars:
+                break
+            if oldest == self.DIGEST:
+                continue
+            if oldest == item_id:
+                break
+            evicted.append(oldest)
+            turns -= 1
+            turn_chars -= len(self._items[oldest].text)
+            digest_chars += len(self._items[oldest].text)
+        if evicted:
+            self._compact(evicted)
+        return item_id
+
+    def remove(self, item_id: int) -> None:
+        self.chars -= len(self._items[item_id].text)
+        super().remove(item_id)
+
+    def _turns(self) -> int:
+        return len(self._items) - (self.DIGEST in self._items)
+
+    def _compact(self, evicted: list) -> None:
+        """fold the evicted turns (ids, oldest first) and the current digest into a new digest"""
+        digest = self._items.get(self.DIGEST)
+        text = ''
+        # entity ids in recency order, oldest first, so the cap drops the oldest
+        recent = {}
+        if digest is not None:
+            text = digest.text
+            recent = dict.fromkeys(digest.entities)
+        for item in (self._items[item_id] for item_id in evicted):
+            text += item.text
+            for pid in item.entities:
+                recent.pop(pid, None)
+                recent[pid] = None
+        per_key = {}
+        for pid in recent:
+            per_key.setdefault(ENTITIES.pair(pid)[0], []).append(pid)
+        kept = sorted(pid for pids in per_key.values() for pid in pids[-self.digest_entities:])
+        compacted = MemoryEntry(text[-self.digest_chars:], array('I', kept))
+        # take the digest's references before the items holding the kept ids now are removed, so none is recycled
+        ENTITIES.acquire(compacted.entities)
+        for item_id in ([self.DIGEST] if digest is not None else []) + evicted:
+            self.remove(item_id)
+        self._put(self.DIGEST, compacted, held=True)
+        # the digest sorts first by id, keep it first in iteration order too
+        self._items = {self.DIGEST: self._items.pop(self.DIGEST), **self._items}
+        self.chars += len(compacted.text)
+        self.compacted += len(evicted)
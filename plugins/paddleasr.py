@@ -21,9 +21,18 @@ def silk2wav(input_silk, out_wav, sr, out_pcm="temp.pcm"):
         return None
 
 
-asr_model = ASRExecutor()
+asr_model = None
 #text_punc = TextExecutor()
 
+
+def get_asr_model() -> ASRExecutor:
+    """the model is loaded on first use, in the inference worker rather than at import"""
+    global asr_model
+    if asr_model is None:
+        asr_model = ASRExecutor()
+    return asr_model
+
+
 def asr(talker: str, input_silk: str, cache_url: str) -> str:
     timestmp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
     outwav = os.path.join(cache_url, f"asr_{talker}{timestmp}.wav")
@@ -31,7 +40,7 @@ def asr(talker: str, input_silk: str, cache_url: str) -> str:
     trans_result = silk2wav(input_silk, outwav, sr=16000, out_pcm=outpcm)
     if trans_result:
         out_wav, _ = trans_result
-        asr_result = asr_model(out_wav, force_yes=True)
+        asr_result = get_asr_model()(out_wav, force_yes=True)
     else:
         return "######"
     return asr_result
@@ -0,0 +1,60 @@
+class PromptBuilder:
+    """
+    assembles the pre_prompt of DramaPlugin.soul:
+    relations of 你 and the character + self memory + DESCRIPTIONTEXT + 刚才 recent memory ，现在 last_dialog + 你
+    the static parts are precomputed per (scenario, character) when the scenarios load.
+    with budget > 0 (chars, roughly yuan tokens for chinese) the variable sections are cut by priority:
+    the older part of the recent memory goes first, then the tail of the self memory, at last the older part of
+    last_dialog. the static parts are never cut
+    """
+    def __init__(self, relations: dict, scenarios: dict, budget: int = 1000) -> None:
+        self.budget = budget
+        self.relations = relations
+        self.static = {}
+        self.rebuild(scenarios)
+
+        self.count = 0
+        self.total = 0
+        self.longest = 0
+        self.truncated = 0
+
+    def rebuild(self, scenarios: dict) -> None:
+        """precompute the static parts, call again after the scenarios reload"""
+        head = self.relations.get("你", "")
+        self.static = {(scenario, character): (head + self.relations.get(character, ''), rules.get('DESCRIPTIONTEXT', ''))
+                       for scenario, characters in scenarios.items() for character, rules in characters.items()}
+
+    def _static(self, scenario: str, character: str, rules: dict) -> tuple:
+        parts = self.static.get((scenario, character))
+        if parts is None:
+            # characters not in the scenario sheet get the rules of another column, see on_message
+            parts = (self.relations.get("你", "") + self.relations.get(character, ''), rules.get('DESCRIPTIONTEXT', ''))
+        return parts
+
+    def build(self, scenario: str, character: str, rules: dict, selfmemory_text: str, memory_text: str, last_dialog: str) -> str:
+        head, description = self._static(scenario, character, rules)
+        if self.budget > 0:
+            # 刚才 ，现在 你
+            over = len(head) + len(description) + len(selfmemory_text) + len(memory_text) + len(last_dialog) + 6 - self.budget
+            if over > 0:
+                self.truncated += 1
+                cut = min(over, len(memory_text))
+                memory_text, over = memory_text[cut:], over - cut
+                cut = min(over, len(selfmemory_text))
+                selfmemory_text, over = selfmemory_text[:len(selfmemory_text) - cut], over - cut
+                if over > 0:
+                    last_dialog = last_dialog[min(over, len(last_dialog)):]
+
+        if memory_text:
+            pre_prompt = head + selfmemory_text + description + '刚才' + memory_text + '，现在' + last_dialog + "你"
+        else:
+            pre_prompt = head + selfmemory_text + description + last_dialog + "你"
+
+        self.count += 1
+        self.total += len(pre_prompt)
+        self.longest = max(self.longest, len(pre_prompt))
+        return pre_prompt
+
+    def stats(self) -> dict:
+        return {'prompts': self.count, 'avg_chars': round(self.total / self.count, 1) if self.count else 0,
+                'max_chars': self.longest, 'truncated': self.truncated, 'budget': self.budget}
@@ -0,0 +1,107 @@
+import os
+import hashlib
+import numpy as np
+
+
+class Embedder:
+    """
+    sentence embeddings on CPU: the pooled output of a PaddleNLP encoder, L2 normalized so dot product is cosine.
+    runs in the inference workers, see plugins.inference.embed_texts
+    """
+    def __init__(self, model: str = 'simbert-base-chinese', max_seq_len: int = 64, batch_size: int = 32) -> None:
+        import paddle
+        from paddlenlp.transformers import AutoModel, AutoTokenizer
+        self.paddle = paddle
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        self.model = AutoModel.from_pretrained(model)
+        self.model.eval()
+        self.max_seq_len = max_seq_len
+        self.batch_size = batch_size
+
+    def __call__(self, texts: list) -> np.ndarray:
+        vectors = []
+        with self.paddle.no_grad():
+            for b in range(0, len(texts), self.batch_size):
+                encoded = self.tokenizer(texts[b:b + self.batch_size], max_seq_len=self.max_seq_len,
+                                         pad_to_max_seq_len=True, return_dict=False)
+                input_ids = self.paddle.to_tensor([e['input_ids'] for e in encoded])
+                token_type_ids = self.paddle.to_tensor([e['token_type_ids'] for e in encoded])
+                _, pooled = self.model(input_ids, token_type_ids=token_type_ids)
+                vectors.append(pooled.numpy())
+        matrix = np.concatenate(vectors).astype(np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+class EmbeddingMatrix:
+    """
+    normalized vectors of memory items in one contiguous float32 matrix (capacity doubles as it fills),
+    removal moves the last row into the hole. search is a single matrix product per batch of queries
+    """
+    def __init__(self, dim: int, capacity: int = 64) -> None:
+        self.dim = dim
+        self.size = 0
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._rows = {}
+
+    def add(self, item_id: int, vector: np.ndarray) -> None:
+        if self.size == len(self._matrix):
+            self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._ids = np.concatenate([self._ids, np.zeros_like(self._ids)])
+        self._matrix[self.size] = vector
+        self._ids[self.size] = item_id
+        self._rows[item_id] = self.size
+        self.size += 1
+
+    def remove(self, item_id: int) -> None:
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._ids[row] = self._ids[last]
+            self._rows[int(self._ids[row])] = row
+        self.size = last
+
+    def search(self, queries: np.ndarray, k: int = 3, min_score: float = 0.0) -> list:
+        """top k (item id, cosine) per query row, best first"""
+        queries = np.atleast_2d(queries)
+        if self.size == 0:
+            return [[] for _ in range(len(queries))]
+        scores = queries @ self._matrix[:self.size].T
+        k = min(k, self.size)
+        results = []
+        for row in scores:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([(int(self._ids[i]), float(row[i])) for i in top if row[i] >= min_score])
+        return results
+
+
+def load_vectors(path: str, lines: list, embed, stamp: str = '') -> np.ndarray:
+    """
+    embeddings of lines, one row per line. rows are persisted in an npz keyed by line sha1,
+    only lines not in it (or all of them when the model stamp changed) go through embed(texts) -> matrix
+    """
+    keys = [hashlib.sha1(line.encode('utf-8')).hexdigest() for line in lines]
+    known = {}
+    if os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data['stamp']) == stamp:
+                    known = dict(zip(data['keys'].tolist(), data['matrix']))
+        except (OSError, KeyError, ValueError):
+            known = {}
+
+    missing = list(dict.fromkeys(line for line, key in zip(lines, keys) if key not in known))
+    if missing:
+        for line, vector in zip(missing, embed(missing)):
+            known[hashlib.sha1(line.encode('utf-8')).hexdigest()] = vector
+    matrix = np.stack([known[key] for key in keys]).astype(np.float32) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    if missing or len(known) != len(set(keys)):
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp, stamp=np.array(stamp), keys=np.array(keys), matrix=matrix)
+        os.replace(tmp, path)
+    return matrix
@@ -0,0 +1,101 @@
+"""
+local stand-in for the generation service, to load-test and benchmark the pipeline offline.
+
+serve: python -m plugins.standin serve --port 8090 --latency lognormal --median 1.5 --sigma 0.5 --replies replies.txt
+       POST /generate {"prompt": ..., "trun": ...} -> {"reply": ...} after a sampled delay
+bench: python -m plugins.standin bench --backend '{"type": "local"}' --concurrency 50 --requests 500
+       fires generations through any backend config and prints the latency percentiles
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from aiohttp import web
+from plugins.backends import create_backend
+
+DEFAULT_REPLIES = ['你好呀', '这个问题很有意思，让我想一想', '哈哈，你说得对', '我也是这么觉得的', '再说说你的看法吧']
+
+
+def make_latency(kind: str, median: float, sigma: float, low: float, high: float):
+    """sampler of the per-request delay in seconds"""
+    if kind == 'fixed':
+        return lambda: median
+    if kind == 'uniform':
+        return lambda: random.uniform(low, high)
+    # lognormal with the given median, the usual shape of generation latency
+    return lambda: random.lognormvariate(0, sigma) * median
+
+
+def make_app(latency, replies: list, failure_rate: float = 0.0) -> web.Application:
+    async def generate(request: web.Request) -> web.Response:
+        payload = await request.json()
+        await asyncio.sleep(latency())
+        if random.random() < failure_rate:
+            return web.json_response({'reply': ''}, status=503)
+        reply = random.choice(replies)
+        trun = payload.get('trun')
+        if trun:
+            reply = reply.split(trun)[0]
+        return web.json_response({'reply': reply})
+
+    app = web.Application()
+    app.router.add_post('/generate', generate)
+    return app
+
+
+async def bench(backend_config: dict, concurrency: int, requests: int, prompt: str) -> dict:
+    backend = create_backend(backend_config)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            start = time.monotonic()
+            reply = await backend.generate(prompt)
+            latencies.append(time.monotonic() - start)
+            if not reply:
+                failures += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.monotonic() - start
+    await backend.aclose()
+
+    latencies.sort()
+    return {'requests': requests, 'failures': failures, 'throughput': requests / elapsed,
+            'p50': latencies[len(latencies) // 2], 'p90': latencies[int(len(latencies) * 0.9)],
+            'p99': latencies[int(len(latencies) * 0.99)], 'max': latencies[-1]}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generation stand-in server and benchmark')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve')
+    serve_parser.add_argument('--port', type=int, default=8090)
+    serve_parser.add_argument('--latency', choices=['fixed', 'uniform', 'lognormal'], default='lognormal')
+    serve_parser.add_argument('--median', type=float, default=1.5, help='fixed delay or lognormal median, seconds')
+    serve_parser.add_argument('--sigma', type=float, default=0.5, help='lognormal sigma')
+    serve_parser.add_argument('--low', type=float, default=0.5, help='uniform lower bound, seconds')
+    serve_parser.add_argument('--high', type=float, default=3.0, help='uniform upper bound, seconds')
+    serve_parser.add_argument('--failure-rate', type=float, default=0.0)
+    serve_parser.add_argument('--replies', default='', help='file of canned replies, one per line')
+
+    bench_parser = sub.add_parser('bench')
+    bench_parser.add_argument('--backend', default='{"type": "local"}', help='backend config as json')
+    bench_parser.add_argument('--concurrency', type=int, default=20)
+    bench_parser.add_argument('--requests', type=int, default=200)
+    bench_parser.add_argument('--prompt', default='你叫晓燕，今年17岁，是一个爱读书的女孩。陌生人说：“你好”你说：“')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        replies = DEFAULT_REPLIES
+        if args.replies:
+            with open(args.replies, 'r', encoding='utf-8') as f:
+                replies = [line.strip() for line in f if line.strip()]
+        app = make_app(make_latency(args.latency, args.median, args.sigma, args.low, args.high), replies, args.failure_rate)
+        web.run_app(app, port=args.port)
+    else:
+        print(asyncio.run(bench(json.loads(args.backend), args.concurrency, args.requests, args.prompt)))
@@ -0,0 +1,186 @@
+"""
+static graph / ONNX int8 inference of the fine-tuned UIE checkpoint, for CPU-only nodes.
+
+export:  python -m plugins.uieonnx export --model uie/checkpoint/model_best --output uie/export
+         writes the static graph (inference.pdmodel/pdiparams), inference.onnx and the int8 inference.int8.onnx
+compare: python -m plugins.uieonnx compare --model uie/checkpoint/model_best --onnx uie/export/inference.int8.onnx
+                 --test uie/data/test.txt --threads 2
+         precision/recall/F1 and latency of the Taskflow and the ONNX predictor on the held-out doccano split
+"""
+import os
+import json
+import time
+import argparse
+
+# the UIE inputs, in the order of the exported graph
+INPUT_NAMES = ['input_ids', 'token_type_ids', 'pos_ids', 'att_mask']
+
+
+def export_static(model_path: str, output_path: str) -> str:
+    """dygraph checkpoint -> static inference graph, returns the path prefix"""
+    import paddle
+    from paddlenlp.taskflow.models import UIE
+    model = UIE.from_pretrained(model_path)
+    model.eval()
+    model = paddle.jit.to_static(model, input_spec=[paddle.static.InputSpec(shape=[None, None], dtype='int64', name=name)
+                                                    for name in INPUT_NAMES])
+    prefix = os.path.join(output_path, 'inference')
+    paddle.jit.save(model, prefix)
+    return prefix
+
+
+def export_onnx(prefix: str, quantize: bool = True) -> str:
+    """static graph -> ONNX, with int8 dynamic quantization of the weights. returns the model to serve"""
+    import paddle2onnx
+    onnx_model = paddle2onnx.command.c_paddle_to_onnx(model_file=prefix + '.pdmodel', params_file=prefix + '.pdiparams',
+                                                      opset_version=13, enable_onnx_checker=True)
+    float_file = prefix + '.onnx'
+    with open(float_file, 'wb') as f:
+        f.write(onnx_model)
+    if not quantize:
+        return float_file
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quant_file = prefix + '.int8.onnx'
+    quantize_dynamic(float_file, quant_file, weight_type=QuantType.QInt8)
+    return quant_file
+
+
+class UIEOnnxPredictor:
+    """
+    UIE entity extraction on onnxruntime with the Taskflow call interface:
+    predictor(texts) -> [{schema key: [{'text', 'start', 'end', 'probability'}]}], set_schema(schema).
+    only flat schemas (the focus.json list) are supported. texts longer than max_seq_len are split and merged
+    back like Taskflow does
+    """
+    def __init__(self, model_file: str, schema: list, tokenizer_path: str = 'uie/checkpoint/model_best',
+                 num_threads: int = 1, max_seq_len: int = 512, batch_size: int = 16, position_prob: float = 0.5) -> None:
+        import onnxruntime as ort
+        from paddlenlp.transformers import AutoTokenizer
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_file, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        self.max_seq_len = max_seq_len
+        self.batch_size = batch_size
+        self.position_prob = position_prob
+        self.set_schema(schema)
+
+    def set_schema(self, schema: list) -> None:
+        if any(not isinstance(key, str) for key in schema):
+            raise RuntimeError('UIEOnnxPredictor only supports a flat list schema')
+        self.schema = list(schema)
+
+    def _predict(self, prompts: list, texts: list) -> list:
+        """spans of every (prompt, text) pair as (start, end, probability) in text offsets"""
+        import numpy as np
+        from paddlenlp.taskflow.utils import get_bool_ids_greater_than, get_span, get_id_and_prob
+        encoded = self.tokenizer(text=prompts, text_pair=texts, truncation=True, max_seq_len=self.max_seq_len,
+                                 pad_to_max_seq_len=True, return_attention_mask=True, return_position_ids=True,
+                                 return_dict=False, return_offsets_mapping=True)
+        feed = {
+            'input_ids': np.array([e['input_ids'] for e in encoded], dtype='int64'),
+            'token_type_ids': np.array([e['token_type_ids'] for e in encoded], dtype='int64'),
+            'pos_ids': np.array([e['position_ids'] for e in encoded], dtype='int64'),
+            'att_mask': np.array([e['attention_mask'] for e in encoded], dtype='int64'),
+        }
+        start_prob, end_prob = self.session.run(None, dict(zip(self.input_names, (feed[name] for name in INPUT_NAMES))))
+        start_ids = get_bool_ids_greater_than(start_prob.tolist(), limit=self.position_prob, return_prob=True)
+        end_ids = get_bool_ids_greater_than(end_prob.tolist(), limit=self.position_prob, return_prob=True)
+        spans = []
+        for starts, ends, e in zip(start_ids, end_ids, encoded):
+            offset_map = [list(offset) for offset in e['offset_mapping']]
+            ids, probs = get_id_and_prob(get_span(starts, ends, with_prob=True), offset_map)
+            spans.append([(start, end, prob) for (start, end), prob in zip(ids, probs)])
+        return spans
+
+    def _pieces(self, prompt: str, text: str) -> list:
+        """
+        (offset, piece) of text cut into max_seq_len - len(prompt) - 3 character pieces, the split Taskflow does
+        so a long text is read whole instead of truncated
+        """
+        size = max(self.max_seq_len - len(prompt) - 3, 1)
+        return [(offset, text[offset:offset + size]) for offset in range(0, max(len(text), 1), size)]
+
+    def __call__(self, texts: list) -> list:
+        pairs = [(key, i, offset, piece) for key in self.schema for i, text in enumerate(texts)
+                 for offset, piece in self._pieces(key, text)]
+        results = [{} for _ in texts]
+        for b in range(0, len(pairs), self.batch_size):
+            batch = pairs[b:b + self.batch_size]
+            spans = self._predict([key for key, _, _, _ in batch], [piece for _, _, _, piece in batch])
+            # spans are offsets in the piece, shifted back to the whole text
+            for (key, i, offset, _), found in zip(batch, spans):
+                entities = [{'text': texts[i][offset + start:offset + end], 'start': offset + start,
+                             'end': offset + end, 'probability': prob}
+                            for start, end, prob in found if end > start]
+                if entities:
+                    results[i].setdefault(key, []).extend(entities)
+        return results
+
+
+def _load_test(path: str) -> list:
+    """doccano split lines {"content", "prompt", "result_list": [{"text", "start", "end"}]}, flat prompts only"""
+    samples = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                sample = json.loads(line)
+                samples.append((sample['content'], sample['prompt'],
+                                {(r['start'], r['end']) for r in sample['result_list']}))
+    return samples
+
+
+def evaluate(predictor, samples: list, threshold: float = 0.58) -> dict:
+    correct = predicted = gold = 0
+    latencies = []
+    for content, prompt, expected in samples:
+        predictor.set_schema([prompt])
+        start = time.perf_counter()
+        result = predictor([content])[0]
+        latencies.append(time.perf_counter() - start)
+        found = {(e['start'], e['end']) for e in result.get(prompt, []) if e['probability'] > threshold}
+        correct += len(found & expected)
+        predicted += len(found)
+        gold += len(expected)
+    precision = correct / predicted if predicted else 0.0
+    recall = correct / gold if gold else 0.0
+    latencies.sort()
+    return {'precision': round(precision, 4), 'recall': round(recall, 4),
+            'f1': round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2) if latencies else 0.0,
+            'p95_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 2) if latencies else 0.0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='UIE static graph / ONNX int8 export and comparison')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = sub.add_parser('export')
+    export_parser.add_argument('--model', default='uie/checkpoint/model_best')
+    export_parser.add_argument('--output', default='uie/export')
+    export_parser.add_argument('--no-quantize', action='store_true', help='keep the fp32 ONNX model only')
+
+    compare_parser = sub.add_parser('compare')
+    compare_parser.add_argument('--model', default='uie/checkpoint/model_best')
+    compare_parser.add_argument('--onnx', nargs='+', default=['uie/export/inference.onnx', 'uie/export/inference.int8.onnx'])
+    compare_parser.add_argument('--test', default='uie/data/test.txt')
+    compare_parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        os.makedirs(args.output, exist_ok=True)
+        static_prefix = export_static(args.model, args.output)
+        print(f'static graph: {static_prefix}.pdmodel')
+        print(f'onnx model: {export_onnx(static_prefix, quantize=not args.no_quantize)}')
+    else:
+        from paddlenlp import Taskflow
+        test_samples = _load_test(args.test)
+        first_prompt = test_samples[0][1] if test_samples else ''
+        taskflow = Taskflow('information_extraction', schema=[first_prompt], task_path=args.model, num_threads=args.threads)
+        print(f'taskflow: {evaluate(taskflow, test_samples)}')
+        for onnx_file in args.onnx:
+            if os.path.exists(onnx_file):
+                onnx_predictor = UIEOnnxPredictor(onnx_file, [first_prompt], tokenizer_path=args.model, num_threads=args.threads)
+                print(f'{os.path.basename(onnx_file)}: {evaluate(onnx_predictor, test_samples)}')
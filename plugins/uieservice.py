@@ -0,0 +1,83 @@
+import asyncio
+import hashlib
+from functools import partial
+from utils.batching import MicroBatcher, TTLCache
+from plugins.inference import InferenceExecutor, uie_topics
+
+
+class UIEService:
+    """
+    UIE topic extraction shared by all conversations.
+    texts submitted within `window` seconds (or until max_batch) from any conversation go to the model as one batch
+    on the InferenceExecutor, so the event loop keeps serving other contacts meanwhile.
+    with several worker processes several batches run at once.
+    acached remembers the topics of each utterance by (text hash, schema version), so the utterances of a turn
+    that were extracted with an earlier message are not sent to the model again.
+    callers may pass a subset of the schema (the keys a scenario uses), texts are batched per subset
+    """
+    def __init__(self, executor: InferenceExecutor, schema: list, window: float = 0.01, max_batch: int = 16,
+                 threshold: float = 0.58, cache_size: int = 8192, cache_ttl: float = 3600.0) -> None:
+        self.executor = executor
+        self.schema = tuple(schema)
+        self.schema_version = 0
+        self.threshold = threshold
+        self.window = window
+        self.max_batch = max_batch
+        self.batchers = {}
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def _batcher(self, schema: tuple) -> MicroBatcher:
+        batcher = self.batchers.get(schema)
+        if batcher is None:
+            batcher = MicroBatcher(partial(self._handle, schema), window=self.window, max_batch=self.max_batch)
+            self.batchers[schema] = batcher
+        return batcher
+
+    async def _handle(self, schema: tuple, texts: list) -> list:
+        return await self.executor.arun(uie_topics, schema, texts, self.threshold)
+
+    def extract(self, texts: list, schema: list = None) -> list:
+        """blocking extraction of a whole list, for loading the memory. schema defaults to the current one"""
+        return self.executor.run(uie_topics, tuple(schema) if schema else self.schema, texts, self.threshold)
+
+    async def atopics(self, texts: list, schema: tuple = None) -> list:
+        """topics of each text, batched with the texts of the other conversations using the same schema"""
+        batcher = self._batcher(schema or self.schema)
+        return list(await asyncio.gather(*(batcher.submit(text) for text in texts)))
+
+    async def acached(self, texts: list, schema: tuple = None) -> list:
+        """atopics through the per-utterance cache, only the texts not seen with the schema reach the model"""
+        schema = schema or self.schema
+        version = (self.schema_version, schema)
+        keys = [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in texts]
+        topics = [self.cache.get((key, version)) for key in keys]
+        missing = list(dict.fromkeys(text for text, topic in zip(texts, topics) if topic is None))
+        if missing:
+            fresh = dict(zip(missing, await self.atopics(missing, schema)))
+            for i, text in enumerate(texts):
+                if topics[i] is None:
+                    topics[i] = fresh[text]
+                    self.cache.put((keys[i], version), topics[i])
+        return topics
+
+    @staticmethod
+    def merge(topics: list) -> dict:
+        """union of the topics of several utterances"""
+        merged = {}
+        for topic in topics:
+            for key, value in topic.items():
+                merged[key] = merged.get(key, set()) | value
+        return merged
+
+    def set_schema(self, schema: list) -> None:
+        """the workers switch schema on their next batch, cached topics of the old schema are no longer used"""
+        self.schema = tuple(schema)
+        self.schema_version += 1
+        self.batchers.clear()
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        batches = sum(batcher.batches for batcher in self.batchers.values())
+        texts = sum(batcher.texts for batcher in self.batchers.values())
+        return {'batches': batches, 'texts': texts, 'mean_batch': texts / batches if batches else 0.0,
+                'schemas': len(self.batchers), 'cache': self.cache.stats()}
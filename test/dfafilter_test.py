@@ -0,0 +1,69 @@
+"""
+equivalence test between the Aho-Corasick scan and the reference trie walk of DFAFilter
+run from the repo root: python -m test.dfafilter_test
+"""
+import random
+import tempfile
+from utils.DFAFilter import DFAFilter, normalize
+
+gfw = DFAFilter(logs=tempfile.mkdtemp())
+gfw.parse()
+
+with open('utils/keywords', encoding='utf-8') as f:
+    keywords = [line.strip() for line in f if line.strip()]
+
+random.seed(666)
+alphabet = list(set(''.join(random.sample(keywords, 300)))) + list('，。的了是我你他 ')
+
+for _ in range(2000):
+    pieces = []
+    for _ in range(random.randint(1, 8)):
+        if random.random() < 0.3:
+            pieces.append(random.choice(keywords)[:random.randint(1, 6)])
+        else:
+            pieces.append(''.join(random.choices(alphabet, k=random.randint(1, 10))))
+    message = ''.join(pieces)
+
+    hits = [(start, end) for _, start, end in gfw.find_all(message)]
+    assert sorted(hits) == sorted(gfw.reference_find_all(message)), message
+    assert gfw.contains(message) == (gfw.reference_filter(message) is not None), message
+    first = gfw.find_first(message)
+    assert (first is None) == (gfw.filter(message) is None), message
+    if first:
+        assert first[2] == min(end for _, end in hits), message
+
+for keyword in random.sample(keywords, 500):
+    message = '今天天气不错' + keyword + '我们出去走走'
+    assert gfw.contains(message), keyword
+    assert any(normalize(k) == normalize(keyword) and s >= 6 and e <= 6 + len(keyword)
+               for k, s, e in gfw.find_all(message)), keyword
+
+# evasions: separators, full-width, case and traditional chars, spans stay in the original text
+assert gfw.find_first('来个全 套吧') == ('全 套', 2, 5)
+assert gfw.find_first('来个全。*套吧') == ('全。*套', 2, 6)
+assert gfw.find_first('有没有法輪功') == ('法輪功', 3, 6)
+assert gfw.contains('加ＱＱ号') == gfw.contains('加qq号')
+assert normalize('ＡＢｃ，國') == 'abc国'
+
+print(gfw.find_all('帮忙点一下这个链接，全套服务'))
+print('DFAFilter equivalence test passed')
+
+# compiled cache is keyed by the keyword file hash and rebuilt when the file changes
+cache = tempfile.mkdtemp()
+source = f'{cache}/words'
+with open(source, 'w', encoding='utf-8') as f:
+    f.write('苹果\n香蕉\n')
+first_build = DFAFilter(logs=cache).compile(source)
+assert DFAFilter(logs=cache).compile(source) == first_build
+fruit = DFAFilter(logs=cache)
+fruit.parse(source)
+assert fruit.contains('我爱吃香蕉') and not fruit.contains('我爱吃菠萝')
+with open(source, 'a', encoding='utf-8') as f:
+    f.write('菠萝\n')
+fruit = DFAFilter(logs=cache)
+fruit.parse(source)
+assert fruit.compile(source) != first_build
+assert fruit.contains('我爱吃菠萝')
+fruit.add('榴莲')
+assert fruit.contains('我爱吃榴莲') and fruit.contains('我爱吃苹果')
+print('DFAFilter compiled cache test passed')
@@ -0,0 +1,85 @@
+"""
+retrieval test of the indexed memory against a linear scan, the bounds of the user memory
+and of the entity table under entity churn
+run from the repo root: python -m test.memorystore_test
+"""
+import random
+import threading
+from plugins.memorystore import IndexedMemory, BoundedMemory, ENTITIES
+
+random.seed(666)
+schema = ['人物', '地点', '时间']
+entities = [f'实体{i}' for i in range(40)]
+items = [{'text': f'第{i}句', **{key: set(random.sample(entities, random.randint(0, 3))) for key in schema}}
+         for i in range(500)]
+
+memory = IndexedMemory()
+ids = [memory.append(item) for item in items]
+for _ in range(100):
+    victim = random.choice(ids)
+    if victim in memory._items:
+        memory.remove(victim)
+alive = [(i, item) for i, item in zip(ids, items) if i in memory._items]
+
+for _ in range(500):
+    key = random.choice(schema)
+    query = set(random.sample(entities, random.randint(1, 4)))
+    expected = [i for i, item in alive if query.intersection(item[key])]
+    assert memory.matching(key, query) == expected, (key, query)
+    for i in expected:
+        assert memory.get(i).get(key, set()) == items[i][key]
+print('IndexedMemory retrieval test passed')
+
+bounded = BoundedMemory(max_items=20, max_chars=200, digest_chars=30, digest_entities=5)
+for item in items:
+    bounded.append(item)
+    assert len(bounded) <= 21 and bounded.chars <= 200
+assert next(iter(bounded)) is bounded.get(BoundedMemory.DIGEST)
+assert all(len(entities) <= 5 for entities in bounded.get(BoundedMemory.DIGEST).topic().values())
+assert bounded.compacted == len(items) - bounded._turns()
+assert [entry.text for entry in bounded][-1] == items[-1]['text']
+
+# the digest text counts toward max_chars too
+tight = BoundedMemory(max_items=3, max_chars=50, digest_chars=40)
+for n, item in enumerate(items):
+    tight.append(dict(item, text=item['text'] * (n % 4 + 1)))
+    assert tight._turns() <= 3 and tight.chars <= 50, tight.chars
+    assert tight.chars == sum(len(entry.text) for entry in tight)
+assert len(tight.get(BoundedMemory.DIGEST).text) <= 25
+print('BoundedMemory bounds test passed')
+
+# short-lived memories and a long conversation, every turn naming new entities
+baseline = len(ENTITIES)
+for n in range(1000):
+    short = IndexedMemory([{'text': f'第{n}句', '人物': {f'路人{n}'}, '地点': {f'地点{n}', '实体1'}}])
+    short.remove(0)
+    bounded.append({'text': f'第{n}句', '人物': {f'新人{n}', f'旧人{n % 7}'}, '时间': {f'第{n}天'}})
+    assert len(ENTITIES) <= baseline + 3 * 21 + 2 * 5
+    assert all(entry.topic() for entry in bounded)
+assert ENTITIES.lookup('人物', '路人0') is None and ENTITIES.lookup('人物', '新人0') is None
+assert bounded.matching('人物', {'新人999'}) == [bounded._next_id - 1]
+print('EntityInterner bounds test passed')
+
+# a self memory built on another thread while compaction releases the same entities, then replaced
+shared = [f'共享{i}' for i in range(8)]
+built = []
+
+
+def load():
+    for n in range(300):
+        topic = {'人物': {shared[n % 8], f'自身{n}'}}
+        built.append((IndexedMemory([{'text': f'自身{n}', **topic}]), topic))
+
+
+loader = threading.Thread(target=load)
+loader.start()
+for n in range(3000):
+    bounded.append({'text': f'第{n}句', '人物': {shared[n % 8]}})
+loader.join()
+for self_memory, topic in built:
+    assert next(iter(self_memory)).topic() == topic
+before = len(ENTITIES)
+for self_memory, _ in built:
+    self_memory.clear()
+assert len(ENTITIES) == before - 300 and ENTITIES.lookup('人物', '自身0') is None
+print('EntityInterner threads test passed')
@@ -0,0 +1,55 @@
+"""
+overflow test of the Yuan scheduler: a full queue pushes out the newest lower priority waiter, or refuses the caller
+run from the repo root: python -m test.scheduler_test
+"""
+import asyncio
+from plugins.inspurai.scheduler import YuanScheduler, SchedulerFull, FIRST, RETRY
+
+
+async def settle():
+    """let the new waiter queue up and the pushed out one see its SchedulerFull"""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def main():
+    scheduler = YuanScheduler(rate=10, burst=1, max_queue=3)
+    await scheduler.acquire(FIRST)
+    order = []
+
+    async def waiter(name, priority):
+        try:
+            await scheduler.acquire(priority)
+            order.append(name)
+        except SchedulerFull:
+            order.append(f'{name} refused')
+
+    tasks = [asyncio.create_task(waiter(name, priority))
+             for name, priority in [('retry1', RETRY), ('first1', FIRST), ('retry2', RETRY)]]
+    await settle()
+    assert scheduler.queue_depth() == 3
+
+    # full: the newest retry makes room for a first request
+    tasks.append(asyncio.create_task(waiter('first2', FIRST)))
+    await settle()
+    assert order == ['retry2 refused'] and scheduler.queue_depth() == 3
+
+    # full again: a retry is refused, nothing queued ranks below it
+    tasks.append(asyncio.create_task(waiter('retry3', RETRY)))
+    await settle()
+    assert order == ['retry2 refused', 'retry3 refused'] and scheduler.queue_depth() == 3
+
+    # a first request pushes out the last retry, then it is refused too once only first requests wait
+    tasks.append(asyncio.create_task(waiter('first3', FIRST)))
+    await settle()
+    tasks.append(asyncio.create_task(waiter('first4', FIRST)))
+    await settle()
+    assert order == ['retry2 refused', 'retry3 refused', 'retry1 refused', 'first4 refused']
+
+    await asyncio.gather(*tasks)
+    assert order[4:] == ['first1', 'first2', 'first3'], order
+    assert scheduler.stats()['rejected'] == 4 and scheduler.queue_depth() == 0
+
+
+asyncio.run(main())
+print('YuanScheduler overflow test passed')
@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 #import time
 #import re
 #import wechaty
@@ -19,12 +20,14 @@ from wechaty_puppet import get_logger
 #from utils.DFAFilter import DFAFilter
 #from utils.rasaintent import RasaIntent
 from plugins.inspurai.inspurai import Yuan
+from plugins.backends import create_backend
 
 
 class Drama:
     def __init__(
             self,
             configs: str = 'drama_configs',
+            backend: dict = None,
     ) -> None:
 
         # 1. create the cache_dir
@@ -76,7 +79,8 @@ class Drama:
                          topK=3,
                          topP=0.9,
                          frequencyPenalty=1.2,)
-
+        # any generation backend config, e.g. {"type": "local"} to run offline against the stand-in server
+        self.backend = create_backend(backend or {}, yuan=self.yuan)
 
     def _file_check(self) -> None:
         """check the config file"""
@@ -151,7 +155,7 @@ class Drama:
                         rules[name][table.cell_value(0, k)][table.cell_value(i, 0)] = table.cell_value(i, k)
         return rules
 
-    def soul(self, scenario: str, character: str) -> str:
+    async def soul(self, scenario: str, character: str) -> str:
         memory_text = ''
         for i in range(len(self.memory[scenario])-1, -1, -1):
             memory_text = self.memory[scenario][i] + memory_text
@@ -161,7 +165,7 @@ class Drama:
         prompt = self.relations.get("你", "") + self.relations.get(character, '') + self.scenarios[scenario][character].get('DESCRIPTIONTEXT', '') + memory_text + "你说：“"
         #print(prompt)
         for i in range(7):
-            reply = self.yuan.submit_API(prompt, trun="”")
+            reply = await self.backend.generate(prompt, trun="”")
             if not reply or reply == "somethingwentwrongwithyuanservice" or reply == "请求异常，请重试":
                 continue
             if len(reply) <= 5 or reply not in memory_text:
@@ -196,14 +200,17 @@ if __name__ == '__main__':
         caixiao.memory['seeagain'].append(f"孙若说：“{text}”")
         zhangjiayi.memory['seeagain'].append(f"孙若说：“{text}”")
     """
-    a = Drama('theater/a')
-    b = Drama('theater/b')
+    async def main():
+        a = Drama('theater/a')
+        b = Drama('theater/b')
 
-    while True:
-        text = a.soul('discuss', 'b')
-        print(f"A说：“{text}”")
-        b.memory['discuss'].append(f"A说：“{text}”")
+        while True:
+            text = await a.soul('discuss', 'b')
+            print(f"A说：“{text}”")
+            b.memory['discuss'].append(f"A说：“{text}”")
+
+            text = await b.soul('discuss', 'a')
+            print(f"B说：“{text}”")
+            a.memory['discuss'].append(f"B说：“{text}”")
 
-        text = b.soul('discuss', 'a')
-        print(f"B说：“{text}”")
-        a.memory['discuss'].append(f"B说：“{text}”")
+    asyncio.run(main())
@@ -5,9 +5,120 @@ https://github.com/guojia60180/sensitive-words-filter
 增加了测试代码，来自https://blog.csdn.net/u013421629/article/details/83178970
 更改了返回模式，返回是否检测到和检测到的敏感词(检测到第一个敏感词就返回）
 关键词数据来自：https://github.com/fwwdn/sensitive-stop-words
+改为Aho-Corasick自动机（失配指针）单遍线性扫描，原字典树保留作为等价性测试的参考实现
+自动机编译为数组表并按关键词文件哈希缓存到磁盘，mmap加载，多个worker共享同一份内存页
+扫描时按预计算的字符归一化表处理全角转半角、繁转简、大小写以及忽略分隔符，命中位置对应原文
 '''
 import os
+import sys
+import mmap
+import struct
+import hashlib
 import logging
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import deque
+from functools import lru_cache
+
+# compiled automaton file: header, then uint32 tables edge_start[n+1] edge_char[e] edge_next[e] fail[n] out[n] link[n],
+# then the normalized utf-8 keyword list (one per line) so the automaton can be extended or the reference trie rebuilt
+ACM_MAGIC = b'AWADAACM'
+ACM_VERSION = 2
+ACM_HEADER = struct.Struct('<8sIIIII')
+
+T2S_FILE = os.path.join(os.path.split(os.path.realpath(__file__))[0], 't2s')
+IGNORE = -1
+
+
+@lru_cache(maxsize=1)
+def normalization_table() -> dict:
+    """
+    char -> canonical code point, or IGNORE for separators users slip into words.
+    full-width to half-width, traditional to simplified (utils/t2s) and lower case are folded together,
+    chars not in the table map to themselves
+    """
+    t2s = {}
+    with open(T2S_FILE, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 2:
+                t2s[line[0]] = line[1]
+
+    table = {}
+    for code in range(0x10000):
+        char = chr(code)
+        canonical = char
+        if 0xFF01 <= code <= 0xFF5E:
+            canonical = chr(code - 0xFEE0)
+        canonical = t2s.get(canonical, canonical)
+        lower = canonical.lower()
+        if len(lower) == 1:
+            canonical = lower
+
+        category = unicodedata.category(canonical)
+        if category[0] in 'PZ' or category in ('Cc', 'Cf', 'Sk', 'Sm') or code == 0x3000:
+            table[char] = IGNORE
+        elif canonical != char:
+            table[char] = ord(canonical)
+    return table
+
+
+def normalize(text: str) -> str:
+    """normalized copy of text, the form keywords are compiled in. not used by the scan itself"""
+    table = normalization_table()
+    chars = []
+    for char in text:
+        code = table.get(char)
+        if code is None:
+            chars.append(char)
+        elif code != IGNORE:
+            chars.append(chr(code))
+    return ''.join(chars)
+
+
+def normalization_version() -> bytes:
+    with open(T2S_FILE, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def _compile(keywords: list) -> tuple:
+    """build the Aho-Corasick automaton of keywords and flatten it into CSR uint32 arrays"""
+    goto, out = [{}], [0]
+    for chars in keywords:
+        node = 0
+        for char in chars:
+            child = goto[node].get(char)
+            if child is None:
+                child = len(goto)
+                goto.append({})
+                out.append(0)
+                goto[node][char] = child
+            node = child
+        out[node] = len(chars)
+
+    # failure links and output links in BFS order
+    fail, link = [0] * len(goto), [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        node = queue.popleft()
+        for char, child in goto[node].items():
+            if node:
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+            link[child] = fail[child] if out[fail[child]] else link[fail[child]]
+            queue.append(child)
+
+    edge_start, edge_char, edge_next = array('I', [0]), array('I'), array('I')
+    for edges in goto:
+        for char in sorted(edges):
+            edge_char.append(ord(char))
+            edge_next.append(edges[char])
+        edge_start.append(len(edge_char))
+
+    return edge_start, edge_char, edge_next, array('I', fail), array('I', out), array('I', link)
 
 
 class DFAFilter:
@@ -29,15 +140,183 @@ class DFAFilter:
         file_handler.setLevel('INFO')
         self.logger.addHandler(file_handler)
 
+        # reference trie, only built when a reference_* method is called
         self.keywords_chains = {}
         self.delimit = '\x00'
 
+        # compiled Aho-Corasick automaton, node 0 is the root
+        # out: length of the keyword ending at the node (0 for none)
+        # link: nearest node on the failure chain that ends a keyword
+        self._edge_start = self._edge_char = self._edge_next = array('I', [0, 0])
+        self._fail = self._out = self._link = array('I', [0])
+        self._root = {}
+        self._blob = b''
+        self._longest = 1
+        self._mmap = None
+        self._pending = []
+        self._table = normalization_table()
+
     def add(self, keyword):
-        keyword = keyword.lower()
-        chars = keyword.strip()
+        chars = normalize(keyword.strip())
         if not chars:
             return
+        self._pending.append(chars)
+        self.keywords_chains = {}
+
+    def keywords(self) -> list:
+        """all keywords known to the filter, compiled ones first"""
+        compiled = bytes(self._blob).decode('utf-8').split('\n') if self._blob else []
+        return compiled + self._pending
+
+    file = os.path.split(os.path.realpath(__file__))[0]
+
+    def parse(self, path=os.path.join(file, 'keywords')):
+        if self._pending or self._blob:
+            # extending an existing keyword set, compile in memory only
+            with open(path, encoding='utf-8') as f:
+                for keyword in f:
+                    self.add(keyword.strip())
+            self._build()
+            return
+        self._load(self.compile(path))
+
+    def compile(self, path=os.path.join(file, 'keywords')) -> str:
+        """compile the keyword file into the cache_dir, keyed by its hash. return the compiled file path"""
+        with open(path, 'rb') as f:
+            source = f.read()
+        digest = hashlib.sha1(source + struct.pack('<I', ACM_VERSION) + sys.byteorder.encode()
+                              + normalization_version()).hexdigest()[:16]
+        name = os.path.basename(path)
+        target = os.path.join(self.cache_dir, f'{name}-{digest}.acm')
+        if os.path.exists(target):
+            return target
+
+        keywords = []
+        for keyword in source.decode('utf-8').splitlines():
+            chars = normalize(keyword.strip())
+            if chars:
+                keywords.append(chars)
+        tables = _compile(keywords)
+        blob = '\n'.join(keywords).encode('utf-8')
 
+        tmp = f'{target}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(ACM_HEADER.pack(ACM_MAGIC, ACM_VERSION, len(tables[3]), len(tables[1]), len(blob),
+                                    max(map(len, keywords), default=1)))
+            for table in tables:
+                table.tofile(f)
+            f.write(blob)
+        os.replace(tmp, target)
+
+        # the source changed, drop the stale compiled files of the same keyword file
+        for stale in os.listdir(self.cache_dir):
+            if stale.startswith(f'{name}-') and stale.endswith('.acm') and stale != os.path.basename(target):
+                try:
+                    os.remove(os.path.join(self.cache_dir, stale))
+                except OSError:
+                    pass
+
+        self.logger.info(f'compiled {len(keywords)} keywords from {path} into {target}')
+        return target
+
+    def _load(self, path):
+        """map a compiled automaton read-only, the tables are views on the shared pages"""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, nodes, edges, blob_len, longest = ACM_HEADER.unpack_from(mm, 0)
+        if magic != ACM_MAGIC or version != ACM_VERSION:
+            mm.close()
+            raise RuntimeError(f'{path} is not a compiled keyword automaton of version {ACM_VERSION}')
+
+        view = memoryview(mm)
+        offset = ACM_HEADER.size
+        tables = []
+        for length in (nodes + 1, edges, edges, nodes, nodes, nodes):
+            tables.append(view[offset:offset + 4 * length].cast('I'))
+            offset += 4 * length
+        self._set_tables(*tables, blob=view[offset:offset + blob_len], longest=longest)
+        self._mmap = mm
+
+    def _build(self):
+        """recompile compiled + pending keywords in memory"""
+        keywords = self.keywords()
+        self._set_tables(*_compile(keywords), blob='\n'.join(keywords).encode('utf-8'),
+                         longest=max(map(len, keywords), default=1))
+        self._mmap = None
+
+    def _set_tables(self, edge_start, edge_char, edge_next, fail, out, link, blob, longest):
+        self._edge_start, self._edge_char, self._edge_next = edge_start, edge_char, edge_next
+        self._fail, self._out, self._link = fail, out, link
+        # the root fans out to most of the alphabet, a dict beats bisect there
+        self._root = {edge_char[k]: edge_next[k] for k in range(edge_start[0], edge_start[1])}
+        self._blob = blob
+        self._longest = longest
+        self._pending = []
+
+    def _scan(self, message):
+        """
+        single pass over message, yields (start, end) of every keyword hit in the order they complete.
+        chars are normalized through the table on the fly, ignorable ones are stepped over, so spans
+        point into the original message and may contain separators
+        """
+        if self._pending:
+            self._build()
+
+        edge_start, edge_char, edge_next = self._edge_start, self._edge_char, self._edge_next
+        fail, out, link, root, table = self._fail, self._out, self._link, self._root, self._table
+        # ring buffer of the original offsets of the last consumed chars
+        size = self._longest
+        offsets = [0] * size
+        consumed = 0
+        node = 0
+        for i, char in enumerate(message):
+            code = table.get(char)
+            if code is None:
+                code = ord(char)
+            elif code == IGNORE:
+                continue
+            offsets[consumed % size] = i
+            consumed += 1
+
+            while node:
+                lo, hi = edge_start[node], edge_start[node + 1]
+                k = bisect_left(edge_char, code, lo, hi)
+                if k < hi and edge_char[k] == code:
+                    node = edge_next[k]
+                    break
+                node = fail[node]
+            else:
+                node = root.get(code, 0)
+
+            hit = node if out[node] else link[node]
+            while hit:
+                yield offsets[(consumed - out[hit]) % size], i + 1
+                hit = link[hit]
+
+    def find_first(self, message):
+        """return (keyword, start, end) of the first keyword completed in message, or None"""
+        for start, end in self._scan(message):
+            return message[start:end], start, end
+        return None
+
+    def find_all(self, message):
+        """return every (keyword, start, end) hit in message, overlapping hits included"""
+        return [(message[start:end], start, end) for start, end in self._scan(message)]
+
+    def contains(self, message):
+        for _ in self._scan(message):
+            return True
+        return False
+
+    def filter(self, message):
+        hit = self.find_first(message)
+        if hit is None:
+            return None
+        self.logger.info(f"文本：{message}'，检测到敏感词：{hit[0]}")
+        return hit[0]
+
+    def _add_reference(self, chars):
+        """the original nested-dict trie, kept as the reference implementation"""
         level = self.keywords_chains
         for i in range(len(chars)):
             if chars[i] in level:
@@ -58,31 +337,54 @@ class DFAFilter:
         if i == len(chars)-1:
             level[self.delimit] = 0
 
-    file = os.path.split(os.path.realpath(__file__))[0]
+    def _reference_chains(self) -> dict:
+        if not self.keywords_chains:
+            for chars in self.keywords():
+                self._add_reference(chars)
+        return self.keywords_chains
 
-    def parse(self, path=os.path.join(file, 'keywords')):
-        with open(path, encoding='utf-8') as f:
-            for keyword in f:
-                self.add(keyword.strip())
+    def _reference_normalize(self, message):
+        """normalized copy of message with the original offset of every kept char"""
+        chars, offsets = [], []
+        for i, char in enumerate(message):
+            code = self._table.get(char)
+            if code == IGNORE:
+                continue
+            chars.append(char if code is None else chr(code))
+            offsets.append(i)
+        return ''.join(chars), offsets
 
-    def filter(self, message):
-        message = message.lower()
-        start = 0
-        while start < len(message):
-            res = []
-            level = self.keywords_chains
-            for char in message[start:]:
-                if char in level:
-                    if self.delimit not in level[char]:
-                        level = level[char]
-                        res.append(char)
-                    else:
-                        res.append(char)
-                        self.logger.info(f"文本：{message}'，检测到敏感词：{''.join(res)}")
-                        return ''.join(res)
-            start += 1
+    def reference_filter(self, message):
+        """original start-offset trie walk, O(len(message) × longest keyword), for equivalence tests only"""
+        chains = self._reference_chains()
+        message, _ = self._reference_normalize(message)
+        for start in range(len(message)):
+            level = chains
+            for end in range(start, len(message)):
+                char = message[end]
+                if char not in level or char == self.delimit:
+                    break
+                level = level[char]
+                if self.delimit in level:
+                    return message[start:end+1]
         return None
 
+    def reference_find_all(self, message):
+        """every (start, end) hit found by the reference trie walk, as offsets into the original message"""
+        chains = self._reference_chains()
+        message, offsets = self._reference_normalize(message)
+        hits = []
+        for start in range(len(message)):
+            level = chains
+            for end in range(start, len(message)):
+                char = message[end]
+                if char not in level or char == self.delimit:
+                    break
+                level = level[char]
+                if self.delimit in level:
+                    hits.append((offsets[start], offsets[end]+1))
+        return hits
+
 
 if __name__ == "__main__":
     import time
@@ -0,0 +1,98 @@
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+
+class TTLCache:
+    """
+    bounded LRU cache whose entries also expire ttl seconds after they were put.
+    used for rasa intents of short repeated messages and UIE topics of utterances
+    """
+    def __init__(self, maxsize: int = 4096, ttl: float = 600.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None or time.monotonic() - item[1] > self.ttl:
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, value) -> None:
+        self._data[key] = (value, time.monotonic())
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+
+class MicroBatcher:
+    """
+    micro-batcher: texts submitted by concurrent callers within `window` seconds (or until max_batch)
+    are handed to `handler` together and every caller's future is resolved with its own result.
+    handler: async (list of unique texts) -> list of results in the same order
+    """
+    def __init__(self, handler, window: float = 0.005, max_batch: int = 32) -> None:
+        self.handler = handler
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.texts = 0
+        self._pending = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.ensure_future(self._run(pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, pending: list) -> None:
+        texts = list(dict.fromkeys(text for text, _ in pending))
+        self.batches += 1
+        self.texts += len(pending)
+        try:
+            results = dict(zip(texts, await self.handler(texts)))
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in pending:
+            if not future.done():
+                future.set_result(results[text])
+
+    def stats(self) -> dict:
+        return {'batches': self.batches, 'texts': self.texts,
+                'mean_batch': self.texts / self.batches if self.batches else 0.0}
@@ -0,0 +1,111 @@
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """
+    circuit breaker for a flaky backend.
+    closed: calls pass, the outcome of the last `window` calls is kept; when at least `min_calls` were seen and the
+    failure rate reaches `failure_rate` the circuit opens.
+    open: calls fail fast for `reset_timeout` seconds, then the circuit goes half open.
+    half_open: `half_open_calls` trial calls pass, all succeeding closes the circuit, any failure opens it again,
+    trials that never report back (e.g. cancelled calls) are given up after another `reset_timeout`.
+    every transition is recorded and passed to the listeners as (name, old_state, new_state)
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self,
+                 name: str = 'breaker',
+                 window: int = 20,
+                 min_calls: int = 5,
+                 failure_rate: float = 0.5,
+                 reset_timeout: float = 30.0,
+                 half_open_calls: int = 1,
+                 ) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+
+        self.state = self.CLOSED
+        self.transitions = deque(maxlen=20)
+        self.listeners = []
+        self.fast_failed = 0
+        self._results = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+
+    def add_listener(self, listener) -> None:
+        self.listeners.append(listener)
+
+    def _transit(self, state: str) -> None:
+        old, self.state = self.state, state
+        self.transitions.append((time.time(), old, state))
+        for listener in self.listeners:
+            listener(self.name, old, state)
+
+    def allow(self) -> bool:
+        """whether a call may go to the backend now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.fast_failed += 1
+                return False
+            self._half_open()
+
+        if self.state == self.HALF_OPEN:
+            if self._trials >= self.half_open_calls and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._half_open()
+            if self._trials >= self.half_open_calls:
+                self.fast_failed += 1
+                return False
+            self._trials += 1
+        return True
+
+    def rejecting(self) -> bool:
+        """whether calls are being failed fast right now, without taking a half-open trial slot"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at < self.reset_timeout
+        if self.state == self.HALF_OPEN:
+            return self._trials >= self.half_open_calls and time.monotonic() - self._opened_at < self.reset_timeout
+        return False
+
+    def record_success(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._trial_successes += 1
+            if self._trial_successes >= self.half_open_calls:
+                self._results.clear()
+                self._transit(self.CLOSED)
+            return
+        self._results.append(True)
+
+    def record_failure(self) -> None:
+        if self.state == self.HALF_OPEN:
+            self._open()
+            return
+        self._results.append(False)
+        if self.state == self.CLOSED and len(self._results) >= self.min_calls \
+                and self._results.count(False) / len(self._results) >= self.failure_rate:
+            self._open()
+
+    def _half_open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._trials = self._trial_successes = 0
+        if self.state != self.HALF_OPEN:
+            self._transit(self.HALF_OPEN)
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self._transit(self.OPEN)
+
+    def stats(self) -> dict:
+        failures = self._results.count(False)
+        return {'state': self.state,
+                'failure_rate': failures / len(self._results) if self._results else 0.0,
+                'fast_failed': self.fast_failed,
+                'transitions': [(time.strftime('%m-%d %H:%M:%S', time.localtime(at)), old, new)
+                                for at, old, new in self.transitions]}
@@ -1,7 +1,15 @@
 import urllib3
+import aiohttp
+import asyncio
 import json
 import os
+import re
+import time
 import logging
+import threading
+import unicodedata
+from typing import Optional
+from utils.batching import MicroBatcher, TTLCache
 
 
 class RasaIntent:
@@ -18,7 +26,17 @@ class RasaIntent:
     def __init__(
             self,
             logs: str = '.utils',
-            port: str = '5005',
+            port='5005',
+            timeout: float = 3.0,
+            max_concurrency: int = 8,
+            cache_size: int = 4096,
+            cache_ttl: float = 600.0,
+            cache_max_text: int = 32,
+            version_check_interval: float = 30.0,
+            batch_window: float = 0.005,
+            max_batch: int = 32,
+            probe_interval: float = 0.5,
+            probe_max_interval: float = 30.0,
     ) -> None:
         # 1. create the cache_dir
         self.cache_dir = logs
@@ -37,29 +55,250 @@ class RasaIntent:
         file_handler.setFormatter(log_formatter)
         self.logger.addHandler(file_handler)
 
-        # 3. create the http client
+        # 3. create the rasa urls, port may be a pool of rasa instances: '5005,5006' or ['5005', '5006']
+        if isinstance(port, str):
+            port = port.split(',')
+        self.ports = [str(_port).strip() for _port in port if str(_port).strip()]
+        self.rasa_urls = ['http://localhost:' + _port + '/model/parse' for _port in self.ports]
+        self.rasa_url = self.rasa_urls[0]
+        self._next = 0
+
+        # 4. create the http client
         self.http = urllib3.PoolManager()
 
-        # 4. create the rasa url
-        self.url = 'http://localhost:' + port + '/parse'
+        # 5. async client for the event loop, created lazily inside the running loop
+        # one keep-alive pool, requests beyond max_concurrency per instance wait on the semaphore instead of piling up on rasa
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphores = {}
 
-        # 3. create the http client
-        self.rasa_url = 'http://localhost:'+port+'/model/parse'
-        self.http = urllib3.PoolManager()
+        # concurrent texts are collected into micro-batches fanned out over the instance pool, batch_window=0 turns it off
+        self.batcher = MicroBatcher(self._apredict_batch, window=batch_window, max_batch=max_batch) if batch_window > 0 else None
+
+        # 6. intent cache, keyed by the loaded model so a rasa model reload invalidates it
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.cache_max_text = cache_max_text
+        self.status_url = 'http://localhost:' + self.ports[0] + '/status'
+        self.version_check_interval = version_check_interval
+        self.model_version = ''
+        # the version the cached intents belong to, the cache is cleared by predict/apredict when it falls behind
+        self._cache_version = ''
+        self._version_checked = 0.0
+
+        # 7. readiness: instances are probed by a background thread with exponential backoff instead of a blocking
+        # test parse here, so the bot and rasa can start in parallel. until one is healthy every predict is nlu_fallback
+        self.probe_interval = probe_interval
+        self.probe_max_interval = probe_max_interval
+        self._healthy = set()
+        self._probe_lock = threading.Lock()
+        self._probing = False
+        self._start_probe()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._healthy)
+
+    def _start_probe(self) -> None:
+        with self._probe_lock:
+            if self._probing:
+                return
+            self._probing = True
+        threading.Thread(target=self._probe, name='rasa-probe', daemon=True).start()
+
+    def _probe(self) -> None:
+        delay = self.probe_interval
+        while True:
+            for rasa_url in self.rasa_urls:
+                if rasa_url in self._healthy:
+                    continue
+                try:
+                    _test_data = {'text': '苍老师德艺双馨'}
+                    _encoded_data = json.dumps(_test_data)
+                    _test_res = self.http.request('POST', rasa_url, body=_encoded_data, timeout=self.timeout, retries=False)
+                    _result = json.loads(_test_res.data)
+                except (urllib3.exceptions.HTTPError, ValueError):
+                    continue
+                if isinstance(_result, dict) and _result.get('intent'):
+                    self._healthy.add(rasa_url)
+                    self.logger.info(f'rasa {rasa_url} is ready')
+                    # know the model version before the first cached intent is keyed on it
+                    self._version_checked = 0.0
+                    self._check_model_version()
+
+            with self._probe_lock:
+                if len(self._healthy) == len(self.rasa_urls):
+                    self._probing = False
+                    return
+            time.sleep(delay)
+            delay = min(delay * 2, self.probe_max_interval)
+
+    def _mark_unhealthy(self, rasa_url: str) -> None:
+        with self._probe_lock:
+            if rasa_url not in self._healthy:
+                return
+            self._healthy.discard(rasa_url)
+        self.logger.warning(f'rasa {rasa_url} is down, probing again')
+        if not self._healthy:
+            self.logger.warning('no rasa instance is ready, intents fall back to nlu_fallback')
+        self._start_probe()
+
+    def _cache_key(self, text: str):
+        """NFKC-folded, lower-cased, whitespace-collapsed text + model version, None for texts not worth caching"""
+        text = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip().lower()
+        if not text or len(text) > self.cache_max_text:
+            return None
+        return text, self.model_version
+
+    def _set_model_version(self, status: dict) -> None:
+        version = status.get('model_id') or status.get('fingerprint') or status.get('model_file') or ''
+        if version != self.model_version:
+            if self.model_version:
+                self.logger.info(f'rasa model changed {self.model_version} -> {version}, intent cache cleared')
+            # only recorded here, this also runs on the probe thread while the event loop uses the cache
+            self.model_version = version
+
+    def _sync_cache(self) -> None:
+        """drop the cached intents of an older model, on the caller's side of the cache"""
+        if self._cache_version != self.model_version:
+            self.cache.clear()
+            self._cache_version = self.model_version
+
+    def _check_model_version(self) -> None:
+        if not self.ready or time.monotonic() - self._version_checked < self.version_check_interval:
+            return
+        self._version_checked = time.monotonic()
+        try:
+            _res = self.http.request('GET', self.status_url, timeout=self.timeout)
+            self._set_model_version(json.loads(_res.data))
+        except (urllib3.exceptions.HTTPError, ValueError) as e:
+            self.logger.warning(f'rasa status check failed: {e!r}')
 
-        _test_data = {'text': '苍老师德艺双馨'}
-        _encoded_data = json.dumps(_test_data)
-        _test_res = self.http.request('POST', self.rasa_url, body=_encoded_data)
-        _result = json.loads(_test_res.data)
+    async def _acheck_model_version(self) -> None:
+        if not self.ready or time.monotonic() - self._version_checked < self.version_check_interval:
+            return
+        self._version_checked = time.monotonic()
+        try:
+            async with self._get_session().get(self.status_url,
+                                               timeout=aiohttp.ClientTimeout(total=self.timeout)) as _res:
+                self._set_model_version(await _res.json(content_type=None))
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+            self.logger.warning(f'rasa status check failed: {e!r}')
 
-        if not _result:
-            raise RuntimeError('Rasa server not running, pls start it first and trans the right port in str')
+    def invalidate(self) -> None:
+        """drop every cached intent and re-read the model version on the next predict"""
+        self.cache.clear()
+        self._version_checked = 0.0
 
     def predict(self, text: str):
-        _test_data = {'text': text}
-        _encoded_data = json.dumps(_test_data)
-        _test_res = self.http.request('POST', self.rasa_url, body=_encoded_data)
-        _result = json.loads(_test_res.data)
+        if not self.ready:
+            return 'nlu_fallback', 0.0
+        self._check_model_version()
+        self._sync_cache()
+        key = self._cache_key(text)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        rasa_url = self._next_url()
+        try:
+            _test_data = {'text': text}
+            _encoded_data = json.dumps(_test_data)
+            _test_res = self.http.request('POST', rasa_url, body=_encoded_data, timeout=self.timeout, retries=False)
+            _result = json.loads(_test_res.data) if _test_res.status == 200 else None
+        except (urllib3.exceptions.HTTPError, ValueError) as e:
+            self.logger.warning(f'text: {text}---rasa request failed on {rasa_url}: {e!r}, fall back to nlu_fallback')
+            if isinstance(e, urllib3.exceptions.NewConnectionError):
+                self._mark_unhealthy(rasa_url)
+            return 'nlu_fallback', 0.0
+        if not self._usable(text, rasa_url, _test_res.status, _result):
+            return 'nlu_fallback', 0.0
+        result = self._parse_result(text, _result)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    def _next_url(self) -> str:
+        """round robin over the healthy part of the rasa instance pool"""
+        healthy = [rasa_url for rasa_url in self.rasa_urls if rasa_url in self._healthy] or self.rasa_urls
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next]
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency * len(self.rasa_urls), keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphores = {rasa_url: asyncio.Semaphore(self.max_concurrency) for rasa_url in self.rasa_urls}
+        return self._session
+
+    async def _apost(self, rasa_url: str, text: str, timeout: Optional[float] = None):
+        """one parse request, returns the raw rasa result or None on timeout/connection error or an unusable response"""
+        try:
+            async with self._semaphores[rasa_url]:
+                async with self._get_session().post(rasa_url,
+                                                    data=json.dumps({'text': text}),
+                                                    timeout=aiohttp.ClientTimeout(total=timeout or self.timeout)) as _res:
+                    _result = await _res.json(content_type=None) if _res.status == 200 else None
+                    return _result if self._usable(text, rasa_url, _res.status, _result) else None
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+            self.logger.warning(f'text: {text}---rasa request failed on {rasa_url}: {e!r}')
+            if isinstance(e, aiohttp.ClientConnectionError):
+                self._mark_unhealthy(rasa_url)
+            return None
+
+    async def _apredict_batch(self, texts: list) -> list:
+        """spread one micro-batch evenly over the instance pool"""
+        return await asyncio.gather(*(self._apost(self._next_url(), text) for text in texts))
+
+    async def apredict(self, text: str, timeout: Optional[float] = None):
+        """
+        non-blocking predict for the wechaty event loop.
+        a timeout, connection error or error status, or no ready rasa instance, degrades to nlu_fallback
+        instead of stalling the message
+        """
+        if not self.ready:
+            return 'nlu_fallback', 0.0
+        self._get_session()
+        await self._acheck_model_version()
+        self._sync_cache()
+        key = self._cache_key(text)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        if self.batcher is not None and timeout is None:
+            _result = await self.batcher.submit(text)
+        else:
+            _result = await self._apost(self._next_url(), text, timeout)
+        if _result is None:
+            self.logger.warning(f'text: {text}---fall back to nlu_fallback')
+            return 'nlu_fallback', 0.0
+
+        result = self._parse_result(text, _result)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    async def aclose(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _usable(self, text: str, rasa_url: str, status: int, _result) -> bool:
+        """
+        a 200 with an intent in it. anything else (a 500, a 409 while rasa has no model loaded) is logged and falls
+        back to nlu_fallback uncached, on a 409 the instance goes back to the probe until its model is loaded again
+        """
+        intent = _result.get('intent') if isinstance(_result, dict) else None
+        if status == 200 and isinstance(intent, dict) and 'name' in intent and 'confidence' in intent:
+            return True
+        self.logger.warning(f'text: {text}---rasa answered {status} without an intent on {rasa_url}')
+        if status == 409:
+            self._mark_unhealthy(rasa_url)
+        return False
+
+    def _parse_result(self, text: str, _result: dict):
         _intent = _result['intent']['name']
         _conf = _result['intent']['confidence']
         if _conf >= 0.5 and _intent != 'nlu_fallback':
@@ -71,6 +310,9 @@ class RasaIntent:
 
 if __name__ == "__main__":
     nlu_intent = RasaIntent()
+    while not nlu_intent.ready:
+        print("waiting for rasa server...")
+        time.sleep(1)
     print("====意图侦测测试====")
 
     while True: